@@ -0,0 +1,251 @@
+"""
+法语词典 Excel 导入的差异比对（dry-run）与增量写入
+
+思路：把表格行和数据库行规范化成相同的元组，再分别计算
+- 身份键：(单词, 词性, 中文释义)，与 scripts/update_fr.py 中 import_def_fr 的去重条件一致
+- 内容哈希：身份键 + 英语释义 + 例句
+身份键只在一侧出现 → 新增/删除；两侧都有但内容哈希不同 → 修改。
+增量写入只处理差异部分，重复导入几乎不改动的表格时基本没有数据库写入。
+"""
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from tortoise.transactions import in_transaction
+
+from app.models.fr import DefinitionFr, WordlistFr
+from app.schemas.admin_schemas import PosEnumFr
+from app.utils.textnorm import normalize_texts
+from scripts.update_fr import pos_process
+
+SHEET_NAME_FR = "法英中释义"
+BULK_BATCH_SIZE = 500
+
+DefKey = Tuple[str, Optional[str], str]
+
+_VALID_POS_FR = {p.value for p in PosEnumFr}
+
+
+@dataclass
+class DefRow:
+    word: str
+    pos: Optional[str]
+    meaning: str
+    eng_explanation: Optional[str]
+    example: Optional[str]
+
+    @property
+    def key(self) -> DefKey:
+        return self.word, self.pos, self.meaning
+
+    @property
+    def digest(self) -> str:
+        return row_hash(self.word, self.pos, self.meaning, self.eng_explanation, self.example)
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        return {
+            "word": self.word,
+            "pos": self.pos,
+            "meaning": self.meaning,
+            "eng_explanation": self.eng_explanation,
+            "example": self.example,
+        }
+
+
+@dataclass
+class DictDiff:
+    added_words: List[str] = field(default_factory=list)
+    removed_words: List[str] = field(default_factory=list)
+    added_defs: List[DefRow] = field(default_factory=list)
+    # (数据库中的释义 id, 表格中的新内容)
+    changed_defs: List[Tuple[int, DefRow]] = field(default_factory=list)
+    # (数据库中的释义 id, 数据库中的旧内容)
+    removed_defs: List[Tuple[int, DefRow]] = field(default_factory=list)
+    unchanged_count: int = 0
+    invalid_rows: List[Dict[str, str]] = field(default_factory=list)
+
+    def summary(self, sample_size: int = 50) -> Dict:
+        return {
+            "counts": {
+                "added_words": len(self.added_words),
+                "removed_words": len(self.removed_words),
+                "added_definitions": len(self.added_defs),
+                "changed_definitions": len(self.changed_defs),
+                "removed_definitions": len(self.removed_defs),
+                "unchanged_definitions": self.unchanged_count,
+                "invalid_rows": len(self.invalid_rows),
+            },
+            "added_words": self.added_words[:sample_size],
+            "removed_words": self.removed_words[:sample_size],
+            "added_definitions": [d.to_dict() for d in self.added_defs[:sample_size]],
+            "changed_definitions": [
+                {"id": def_id, **d.to_dict()} for def_id, d in self.changed_defs[:sample_size]
+            ],
+            "removed_definitions": [
+                {"id": def_id, **d.to_dict()} for def_id, d in self.removed_defs[:sample_size]
+            ],
+            "invalid_rows": self.invalid_rows[:sample_size],
+        }
+
+
+def _norm_cell(value) -> Optional[str]:
+    """空单元格 / NaN / 空白字符串统一视为 None"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def row_hash(*values: Optional[str]) -> str:
+    # \x1f（单元分隔符）不会出现在词典文本中，避免 ("ab", "c") 与 ("a", "bc") 撞哈希
+    raw = "\x1f".join("" if v is None else v for v in values)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def read_sheet_rows_fr(path: Path, sheet_name: str = SHEET_NAME_FR) -> Tuple[List[DefRow], List[Dict[str, str]]]:
+    """
+    读取表格并按 import_def_fr 的规则规范化，返回 (有效行, 无效行)
+    """
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    df.columns = [col.strip() for col in df.columns]
+
+    rows: List[DefRow] = []
+    invalid: List[Dict[str, str]] = []
+    for row in df.itertuples():
+        word = _norm_cell(row.单词)
+        if word is None:
+            continue
+
+        meaning = _norm_cell(row[3])
+        if meaning is None:
+            invalid.append({"row": str(row.Index + 2), "word": word, "reason": "中文释义为空"})
+            continue
+
+        raw_pos = _norm_cell(row.词性1)
+        pos = pos_process(raw_pos) if raw_pos else None
+        if pos is not None and pos not in _VALID_POS_FR:
+            invalid.append({"row": str(row.Index + 2), "word": word, "reason": f"词性 {pos} 不合法"})
+            continue
+
+        rows.append(DefRow(
+            word=word,
+            pos=pos,
+            meaning=meaning,
+            eng_explanation=_norm_cell(row.英语释义1),
+            example=_norm_cell(row.法语例句1),
+        ))
+    return rows, invalid
+
+
+async def _load_db_state_fr() -> Tuple[Dict[str, int], Dict[DefKey, Tuple[int, DefRow, str]]]:
+    word_rows = await WordlistFr.all().values("id", "text")
+    words = {w["text"].strip(): w["id"] for w in word_rows}
+
+    def_rows = await DefinitionFr.all().order_by("id").values(
+        "id", "word__text", "pos", "meaning", "eng_explanation", "example"
+    )
+    defs: Dict[DefKey, Tuple[int, DefRow, str]] = {}
+    for d in def_rows:
+        pos = d["pos"].value if hasattr(d["pos"], "value") else d["pos"]
+        item = DefRow(
+            word=d["word__text"].strip(),
+            pos=_norm_cell(pos),
+            meaning=_norm_cell(d["meaning"]) or "",
+            eng_explanation=_norm_cell(d["eng_explanation"]),
+            example=_norm_cell(d["example"]),
+        )
+        # 数据库里若已有重复释义，以 id 最小的一条为准
+        defs.setdefault(item.key, (d["id"], item, item.digest))
+    return words, defs
+
+
+async def diff_fr(path: Path, sheet_name: str = SHEET_NAME_FR) -> DictDiff:
+    sheet_rows, invalid = await asyncio.to_thread(read_sheet_rows_fr, path, sheet_name)
+    db_words, db_defs = await _load_db_state_fr()
+
+    diff = DictDiff(invalid_rows=invalid)
+
+    sheet_words: Dict[str, None] = {}
+    seen_keys = set()
+    for item in sheet_rows:
+        sheet_words.setdefault(item.word, None)
+        if item.key in seen_keys:
+            # 表格内部重复的释义只取第一条，与逐行导入时“已存在则跳过”的行为一致
+            continue
+        seen_keys.add(item.key)
+
+        existing = db_defs.get(item.key)
+        if existing is None:
+            diff.added_defs.append(item)
+        elif existing[2] != item.digest:
+            diff.changed_defs.append((existing[0], item))
+        else:
+            diff.unchanged_count += 1
+
+    diff.added_words = [w for w in sheet_words if w not in db_words]
+    diff.removed_words = [w for w in db_words if w not in sheet_words]
+    diff.removed_defs = [
+        (def_id, item) for key, (def_id, item, _) in db_defs.items() if key not in seen_keys
+    ]
+    return diff
+
+
+async def apply_diff_fr(diff: DictDiff, delete_missing: bool = False) -> Dict[str, int]:
+    """
+    只写入差异部分：
+    - 新词条 / 新释义：bulk_create
+    - 修改的释义：bulk_update（只更新英语释义与例句）
+    - delete_missing=True 时删除表格中已不存在的释义；词条本身不删除（评论、附件等依赖词条）
+    注意 bulk_create 不触发 pre_save 信号，search_text 需在此处手动生成
+    """
+    async with in_transaction():
+        if diff.added_words:
+            search_texts = normalize_texts(diff.added_words)
+            await WordlistFr.bulk_create(
+                [
+                    WordlistFr(text=w, freq=0, search_text=st)
+                    for w, st in zip(diff.added_words, search_texts)
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+        if diff.added_defs:
+            needed = list({d.word for d in diff.added_defs})
+            word_ids = dict(await WordlistFr.filter(text__in=needed).values_list("text", "id"))
+            await DefinitionFr.bulk_create(
+                [
+                    DefinitionFr(
+                        word_id=word_ids[d.word],
+                        pos=d.pos,
+                        meaning=d.meaning,
+                        eng_explanation=d.eng_explanation,
+                        example=d.example,
+                    ) for d in diff.added_defs
+                ],
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+        if diff.changed_defs:
+            new_content = {def_id: d for def_id, d in diff.changed_defs}
+            objs = await DefinitionFr.filter(id__in=list(new_content))
+            for obj in objs:
+                obj.eng_explanation = new_content[obj.id].eng_explanation
+                obj.example = new_content[obj.id].example
+            await DefinitionFr.bulk_update(
+                objs, fields=["eng_explanation", "example"], batch_size=BULK_BATCH_SIZE
+            )
+
+        deleted = 0
+        if delete_missing and diff.removed_defs:
+            deleted = await DefinitionFr.filter(id__in=[def_id for def_id, _ in diff.removed_defs]).delete()
+
+    return {
+        "created_words": len(diff.added_words),
+        "created_definitions": len(diff.added_defs),
+        "updated_definitions": len(diff.changed_defs),
+        "deleted_definitions": deleted,
+        "unchanged_definitions": diff.unchanged_count,
+    }
@@ -0,0 +1,90 @@
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.params import Query
+from fastapi.responses import StreamingResponse
+
+from app.api.admin.admin_dict import import_diff, service
+from app.api.admin.admin_dict.service import ExportFormat, ExportTable
+
+admin_dict_router = APIRouter()
+
+
+@admin_dict_router.get("/export", summary="导出词典数据")
+async def export_dict_api(
+        table: ExportTable = Query(default="fr"),
+        fmt: ExportFormat = Query(default="xlsx"),
+):
+    """
+    流式导出词典数据，xlsx 的表名与列名与 scripts/update_fr.py、scripts/update_jp.py 的导入格式一致
+    :param table: fr（法语词条+释义）/ jp（日语词条+释义）/ proverb_fr（法语谚语）/ idiom_jp（日语惯用语）
+    :param fmt: csv / jsonl / xlsx
+    """
+    filename = service.export_filename(table, fmt, datetime.now().strftime("%Y%m%d"))
+    return StreamingResponse(
+        service.stream_export(table, fmt),
+        media_type=service.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def _save_upload_to_temp(file: UploadFile) -> Path:
+    if not file.filename or not file.filename.endswith((".xlsx", ".xls")):
+        raise HTTPException(status_code=400, detail="文件格式必须为Excel（.xlsx或.xls）")
+
+    suffix = Path(file.filename).suffix
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(await file.read())
+        return Path(tmp.name)
+
+
+@admin_dict_router.post("/import/diff", summary="预览 Excel 导入差异（不写库）")
+async def diff_import_api(
+        file: UploadFile = File(...),
+        sample_size: int = Query(default=50, ge=0, le=1000),
+):
+    """
+    对比上传的法语词典表格与数据库，返回新增 / 修改 / 删除的词条与释义，不做任何写入
+    :param file: DictTable_YYYYMMDD.xlsx
+    :param sample_size: 每类差异最多返回的明细条数（计数不受影响）
+    """
+    tmp_path = await _save_upload_to_temp(file)
+    try:
+        diff = await import_diff.diff_fr(tmp_path)
+    except (ValueError, KeyError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"表格解析失败：{str(e)}")
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return diff.summary(sample_size=sample_size)
+
+
+@admin_dict_router.post("/import/apply", summary="按差异增量导入 Excel")
+async def apply_import_api(
+        file: UploadFile = File(...),
+        delete_missing: bool = Form(False),
+):
+    """
+    与 /import/diff 使用同一套比对结果，只写入变化的部分
+    :param file: DictTable_YYYYMMDD.xlsx
+    :param delete_missing: 是否删除表格中已不存在的释义（默认只新增和修改）
+    """
+    tmp_path = await _save_upload_to_temp(file)
+    try:
+        diff = await import_diff.diff_fr(tmp_path)
+        applied = await import_diff.apply_diff_fr(diff, delete_missing=delete_missing)
+    except (ValueError, KeyError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"表格解析失败：{str(e)}")
+    except Exception as e:
+        # 写入在同一事务中完成，失败时整体回滚
+        raise HTTPException(status_code=500, detail=f"导入失败：{str(e)}")
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return {
+        "message": "导入成功",
+        "applied": applied,
+        "invalid_rows": diff.invalid_rows,
+    }
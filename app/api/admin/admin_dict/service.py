@@ -0,0 +1,205 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+from typing import Any, AsyncIterator, Dict, List, Literal
+
+from openpyxl import Workbook
+
+from app.models.fr import DefinitionFr, ProverbFr
+from app.models.jp import DefinitionJp, IdiomJp
+
+ExportTable = Literal["fr", "jp", "proverb_fr", "idiom_jp"]
+ExportFormat = Literal["csv", "jsonl", "xlsx"]
+
+EXPORT_CHUNK_SIZE = 1000
+FILE_READ_CHUNK = 64 * 1024
+
+# 表头与 scripts/update_fr.py、scripts/update_jp.py 的读取方式保持一致，导出文件可以直接回灌
+# - 法语：import_def_fr 通过 row[3] 读取中文释义，因此中文释义必须位于第 3 列
+# - 日语：import_def_jp 读取 row.词性 / row[6]（中文释义2）/ row.日语例句2，释义写在第 2 组列
+EXPORT_SHEETS: Dict[str, Dict[str, Any]] = {
+    "fr": {
+        "sheet_name": "法英中释义",
+        "columns": ["单词", "词性1", "中文释义1（分号隔开，精简准确）", "英语释义1", "法语例句1"],
+    },
+    "jp": {
+        "sheet_name": "日汉释义",
+        "columns": ["单词", "假名", "词性", "中文释义1", "日语例句1", "中文释义2", "日语例句2"],
+    },
+    "proverb_fr": {
+        "sheet_name": "法语谚语常用表达",
+        "columns": ["法语谚语常用表达", "中文释义"],
+    },
+    "idiom_jp": {
+        "sheet_name": "日语惯用语",
+        "columns": ["惯用语", "假名", "中文释义", "例句"],
+    },
+}
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _clean(value: Any) -> str:
+    if value is None:
+        return ""
+    if hasattr(value, "value"):  # CharEnumField
+        value = value.value
+    return str(value)
+
+
+async def _iter_by_id(model, fields: List[str], chunk_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    按主键做 keyset 分页（id > last_id ORDER BY id LIMIT n），
+    每次只在内存中保留一个分块，避免 OFFSET 越翻越慢，也不会一次性加载整表
+    """
+    last_id = 0
+    while True:
+        rows = await (
+            model.filter(id__gt=last_id)
+            .order_by("id")
+            .limit(chunk_size)
+            .values("id", *fields)
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+        if len(rows) < chunk_size:
+            return
+
+
+async def _iter_fr_rows(chunk_size: int) -> AsyncIterator[List[List[str]]]:
+    fields = ["word__text", "pos", "meaning", "eng_explanation", "example"]
+    async for rows in _iter_by_id(DefinitionFr, fields, chunk_size):
+        yield [
+            [
+                _clean(r["word__text"]),
+                _clean(r["pos"]),
+                _clean(r["meaning"]),
+                _clean(r["eng_explanation"]),
+                _clean(r["example"]),
+            ] for r in rows
+        ]
+
+
+async def _iter_jp_rows(chunk_size: int) -> AsyncIterator[List[List[str]]]:
+    fields = ["word__text", "word__hiragana", "meaning", "example"]
+    async for rows in _iter_by_id(DefinitionJp, fields, chunk_size):
+        # 词性为多对多，按分块批量反查，避免 N+1
+        ids = [r["id"] for r in rows]
+        pos_rows = await DefinitionJp.filter(id__in=ids).values("id", "pos__pos_type")
+        pos_map: Dict[int, List[str]] = {}
+        for p in pos_rows:
+            if p["pos__pos_type"] is not None:
+                pos_map.setdefault(p["id"], []).append(_clean(p["pos__pos_type"]))
+
+        yield [
+            [
+                _clean(r["word__text"]),
+                _clean(r["word__hiragana"]),
+                "・".join(pos_map.get(r["id"], [])),
+                "",
+                "",
+                _clean(r["meaning"]),
+                _clean(r["example"]),
+            ] for r in rows
+        ]
+
+
+async def _iter_proverb_rows(chunk_size: int) -> AsyncIterator[List[List[str]]]:
+    async for rows in _iter_by_id(ProverbFr, ["text", "chi_exp"], chunk_size):
+        yield [[_clean(r["text"]), _clean(r["chi_exp"])] for r in rows]
+
+
+async def _iter_idiom_rows(chunk_size: int) -> AsyncIterator[List[List[str]]]:
+    async for rows in _iter_by_id(IdiomJp, ["text", "search_text", "chi_exp", "example"], chunk_size):
+        yield [
+            [_clean(r["text"]), _clean(r["search_text"]), _clean(r["chi_exp"]), _clean(r["example"])]
+            for r in rows
+        ]
+
+
+ROW_ITERATORS = {
+    "fr": _iter_fr_rows,
+    "jp": _iter_jp_rows,
+    "proverb_fr": _iter_proverb_rows,
+    "idiom_jp": _iter_idiom_rows,
+}
+
+
+async def _stream_csv(table: ExportTable, chunk_size: int) -> AsyncIterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_SHEETS[table]["columns"])
+    # 带 BOM，Excel 打开 UTF-8 CSV 时中文/日文不乱码
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+
+    async for rows in ROW_ITERATORS[table](chunk_size):
+        buf.seek(0)
+        buf.truncate(0)
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+async def _stream_jsonl(table: ExportTable, chunk_size: int) -> AsyncIterator[bytes]:
+    columns = EXPORT_SHEETS[table]["columns"]
+    async for rows in ROW_ITERATORS[table](chunk_size):
+        lines = [json.dumps(dict(zip(columns, row)), ensure_ascii=False) for row in rows]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def _stream_xlsx(table: ExportTable, chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    xlsx 本质是 zip，目录区在文件末尾，无法边查边发；
+    这里使用 openpyxl 的 write_only 模式（行数据直接落临时文件，内存占用恒定），
+    写完后再分块读出临时文件并删除
+    """
+    sheet = EXPORT_SHEETS[table]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet["sheet_name"])
+    ws.append(sheet["columns"])
+    async for rows in ROW_ITERATORS[table](chunk_size):
+        for row in rows:
+            ws.append(row)
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(wb.save, tmp_path)
+        with open(tmp_path, "rb") as f:
+            while True:
+                data = f.read(FILE_READ_CHUNK)
+                if not data:
+                    break
+                yield data
+    finally:
+        os.remove(tmp_path)
+
+
+def stream_export(
+        table: ExportTable,
+        fmt: ExportFormat,
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """
+    返回导出文件的字节流生成器，交给 StreamingResponse 逐块发送
+    :param table: fr / jp / proverb_fr / idiom_jp
+    :param fmt: csv / jsonl / xlsx
+    :param chunk_size: 每次从数据库读取的行数
+    """
+    if fmt == "csv":
+        return _stream_csv(table, chunk_size)
+    if fmt == "jsonl":
+        return _stream_jsonl(table, chunk_size)
+    return _stream_xlsx(table, chunk_size)
+
+
+def export_filename(table: ExportTable, fmt: ExportFormat, date_str: str) -> str:
+    return f"DictTable_{table}_{date_str}.{fmt}"
@@ -0,0 +1,43 @@
+from dataclasses import asdict
+
+from fastapi import APIRouter, Body
+from starlette.requests import Request
+
+from app.core import rate_limit
+
+admin_ratelimit_router = APIRouter()
+
+
+@admin_ratelimit_router.get("/rules", summary="查看速率限制规则")
+async def list_rules_api(request: Request):
+    """
+    各接口的默认限额，以及单独设置过限额的用户
+    """
+    redis = request.app.state.redis
+    return {
+        name: {
+            **asdict(rule),
+            "user_overrides": await rate_limit.get_user_limits(redis, name),
+        }
+        for name, rule in rate_limit.RATE_LIMIT_RULES.items()
+    }
+
+
+@admin_ratelimit_router.put("/{rule_name}/users/{user_id}", summary="设置单个用户的限额")
+async def set_user_limit_api(
+        request: Request,
+        rule_name: str,
+        user_id: int,
+        limit: int = Body(..., embed=True),
+):
+    """
+    覆盖该用户在 rule_name 下的 limit，窗口长度与算法沿用规则默认值
+    """
+    await rate_limit.set_user_limit(request.app.state.redis, rule_name, str(user_id), limit)
+    return {"rule": rule_name, "user_id": user_id, "limit": limit}
+
+
+@admin_ratelimit_router.delete("/{rule_name}/users/{user_id}", summary="恢复用户的默认限额")
+async def clear_user_limit_api(request: Request, rule_name: str, user_id: int):
+    await rate_limit.clear_user_limit(request.app.state.redis, rule_name, str(user_id))
+    return {"rule": rule_name, "user_id": user_id}
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends
 
 from app.api.admin.admin_articles.routes import admin_banner_router
+from app.api.admin.admin_dict.routes import admin_dict_router
+from app.api.admin.admin_ratelimit.routes import admin_ratelimit_router
 from app.utils.security import is_admin_user
 
 admin_router = APIRouter(dependencies=[Depends(is_admin_user)])
 
 admin_router.include_router(admin_banner_router, prefix="/article")
+admin_router.include_router(admin_dict_router, prefix="/dict")
+admin_router.include_router(admin_ratelimit_router, prefix="/ratelimit")
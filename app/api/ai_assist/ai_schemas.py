@@ -45,3 +45,4 @@ class AIAnswerOut(BaseModel):
     answer: str
     model: str
     tokens_used: Optional[int] = None
+    cached: bool = False
@@ -1,24 +1,24 @@
 from typing import Dict, Tuple
 
-import httpx
 from fastapi import APIRouter, HTTPException, Depends, Body, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from starlette.requests import Request
 
 from app.api.ai_assist import service
 from app.api.ai_assist.ai_schemas import AIAnswerResponse, AIAnswerOut, AIQuestionRequest
-from app.api.ai_assist.utils.redis_memory import get_chat_history, save_message, clear_chat_history
+from app.api.ai_assist.utils.redis_memory import get_chat_history, save_turn, clear_chat_history, memory_usage
 from app.api.article_director.service import reply_process
+from app.core.ai_scheduler import ai_bulkhead
+from app.core.http_clients import get_http_client
+from app.core.rate_limit import rate_limit
+from app.core.usage_meter import check_quota, flush_usage, get_usage, record_usage
 from app.models import User
-from app.utils.security import get_current_user
-from settings import settings
+from app.utils.security import get_current_user, is_admin_user
+from app.utils.sse import SSE_HEADERS
 
 ai_router = APIRouter()
 
-ZJU_AI_URL = 'https://chat.zju.edu.cn/api/ai/v1/chat/completions'
-AI_API_KEY = settings.AI_ASSIST_KEY
-MAX_USAGE_PER = 100
-
 CHAT_TTL = 7200
 
 
@@ -26,7 +26,15 @@ class ClearHistoryRequest(BaseModel):
     word: str
 
 
-@ai_router.post("/word/exp", deprecated=False)
+async def _load_history(request: Request, Q: AIQuestionRequest, user: Tuple[User, Dict]):
+    redis = request.app.state.redis
+    user_id = str(user[0].id)
+
+    history = await get_chat_history(redis, user_id, Q.word)
+    return redis, user_id, history
+
+
+@ai_router.post("/word/exp", deprecated=False, dependencies=[Depends(rate_limit("ai_assist"))])
 async def dict_exp(
         request: Request,
         Q: AIQuestionRequest,
@@ -34,50 +42,40 @@ async def dict_exp(
 ):
     """
     该接口仅用于查词页面且为具有MCP功能的
+    首轮提问（没有聊天记录）先查离线预生成的解释与回答缓存，命中时不调用大模型，也不计入使用量
     :param request:
     :param Q:
     :param user:
     :return:
     """
-    if user[0].token_usage > MAX_USAGE_PER and not user[0].is_admin:
-        raise HTTPException(status_code=400, detail="本月API使用量已超")
-
-    redis = request.app.state.redis
-
-    user_id = str(user[0].id)
+    redis, user_id, history = await _load_history(request, Q, user)
     word = Q.word
     question = Q.question
 
-    await service.get_and_set_last_key(redis, word=word, user_id=user_id)
-
-    history = await get_chat_history(redis, user_id, word)
-
-    prompt = (
-        f"用户正在学习词语「{word}」。"
-        f"请回答与该词相关的问题：{question}\n"
-    )
-
-    messages = [
-        {"role": "system", "content": "你是一位语言词典助手，回答要简洁、自然，适合初学者理解。只回答与词汇有关的问题。"},
-    ]
-    messages.extend(history)
-    messages.append(
-        {"role": "user", "content": prompt}
-    )
-
-    payload = {
-        "model": "deepseek-r1-671b",
-        "messages": messages,
-        "stream": False
-    }
+    first_turn = not history
+    if first_turn:
+        cached = await service.get_first_turn_answer(redis, word, question)
+        if cached is not None:
+            await save_turn(redis, user_id, word, question, cached["answer"])
+            return AIAnswerOut(
+                word=word,
+                answer=await reply_process(cached["answer"]),
+                model=cached["model"],
+                tokens_used=0,
+                cached=True,
+            )
 
-    headers = {
-        "Authorization": f"Bearer {AI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    try:
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(ZJU_AI_URL, json=payload, headers=headers)
+    await check_quota(redis, user[0], "ai_assist")
+    messages = service.build_messages(history, word, question)
+    # 舱壁：全局并发上限 + 按用户公平排队，排队过长时返回 503
+    async with ai_bulkhead.slot(user_id):
+        try:
+            client = get_http_client("ai_assist")
+            resp = await client.post(
+                service.ZJU_AI_URL,
+                json=service.build_payload(messages, stream=False),
+                headers=service.request_headers(),
+            )
 
             # 如果状态码不是200，抛异常
             if resp.status_code != 200:
@@ -88,8 +86,11 @@ async def dict_exp(
 
             answer = ai_resp.get_answer()
 
-            await save_message(redis, user_id, word, "user", question)
-            await save_message(redis, user_id, word, "assistant", answer)
+            await save_turn(redis, user_id, word, question, answer)
+            tokens_used = ai_resp.usage.total_tokens if ai_resp.usage else None
+            await record_usage(redis, user_id, "ai_assist", tokens_used)
+            if first_turn:
+                await service.set_cached_answer(redis, word, question, answer, ai_resp.model)
 
             answer = await reply_process(answer)
 
@@ -97,11 +98,68 @@ async def dict_exp(
                 word=word,
                 answer=answer,
                 model=ai_resp.model,
-                tokens_used=ai_resp.usage.total_tokens if ai_resp.usage else None
+                tokens_used=tokens_used
             )
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI调用失败: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"AI调用失败: {str(e)}")
+
+
+@ai_router.post("/word/exp/stream", dependencies=[Depends(rate_limit("ai_assist"))])
+async def dict_exp_stream(
+        request: Request,
+        Q: AIQuestionRequest,
+        user: Tuple[User, Dict] = Depends(get_current_user)
+):
+    """
+    /word/exp 的流式版本（SSE），上游每返回一段就转发给前端：
+    event: reasoning（思考过程）/ delta（回答片段）/ done（结束，附 model 与 tokens_used）/ error
+    完整结束后才写入聊天记录，中途断开不会留下半截记录
+    """
+    redis, user_id, history = await _load_history(request, Q, user)
+
+    first_turn = not history
+    cached = await service.get_first_turn_answer(redis, Q.word, Q.question) if first_turn else None
+    if cached is not None:
+        stream = service.stream_cached_answer(redis, user_id, Q.word, Q.question, cached)
+    else:
+        await check_quota(redis, user[0], "ai_assist")
+        ai_bulkhead.check_admission()
+        messages = service.build_messages(history, Q.word, Q.question)
+        stream = service.stream_word_exp(redis, user[0], Q.word, Q.question, messages)
+
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@ai_router.get("/cache")
+async def list_answer_cache(
+        request: Request,
+        offset: int = Query(default=0, ge=0),
+        limit: int = Query(default=50, ge=1, le=200),
+        admin_user: Tuple[User, dict] = Depends(is_admin_user),
+):
+    """
+    查看首轮提问的回答缓存，按写入时间倒序
+    """
+    return await service.list_cached_answers(request.app.state.redis, offset=offset, limit=limit)
+
+
+@ai_router.delete("/cache")
+async def purge_answer_cache(
+        request: Request,
+        word: str | None = Query(default=None),
+        admin_user: Tuple[User, dict] = Depends(is_admin_user),
+):
+    """
+    清除回答缓存
+    :param word: 只清除该词的缓存；不传则清空全部
+    """
+    removed = await service.purge_cached_answers(request.app.state.redis, word=word)
+    return {"removed": removed}
 
 
 @ai_router.post("/univer")
@@ -124,3 +182,63 @@ async def clear_history(
 
     await clear_chat_history(redis, user_id, target_word)
     return {"msg": f"已清除 {target_word} 的聊天记录"}
+
+
+@ai_router.get("/memory")
+async def get_memory_usage(
+        request: Request,
+        user: Tuple[User, Dict] = Depends(get_current_user),
+):
+    """
+    当前用户聊天记录占用的 Redis 内存
+    """
+    return await memory_usage(request.app.state.redis, str(user[0].id))
+
+
+@ai_router.get("/memory/{user_id}")
+async def get_user_memory_usage(
+        request: Request,
+        user_id: int,
+        admin_user: Tuple[User, dict] = Depends(is_admin_user),
+):
+    """
+    指定用户聊天记录占用的 Redis 内存，仅管理员可用
+    """
+    return await memory_usage(request.app.state.redis, str(user_id))
+
+
+@ai_router.get("/usage")
+async def get_my_usage(
+        request: Request,
+        month: str | None = Query(default=None, pattern=r"^\d{6}$"),
+        user: Tuple[User, Dict] = Depends(get_current_user),
+):
+    """
+    当前用户的月度 AI 用量（调用次数、token 数与配额）
+    :param month: YYYYMM，默认本月
+    """
+    return await get_usage(request.app.state.redis, str(user[0].id), month=month)
+
+
+@ai_router.get("/usage/{user_id}")
+async def get_user_usage(
+        request: Request,
+        user_id: int,
+        month: str | None = Query(default=None, pattern=r"^\d{6}$"),
+        admin_user: Tuple[User, dict] = Depends(is_admin_user),
+):
+    """
+    指定用户的月度 AI 用量，仅管理员可用
+    """
+    return await get_usage(request.app.state.redis, str(user_id), month=month)
+
+
+@ai_router.post("/usage/flush")
+async def flush_token_usage(
+        request: Request,
+        admin_user: Tuple[User, dict] = Depends(is_admin_user),
+):
+    """
+    立即把 Redis 中待落库的 token 用量写入数据库（平时由后台任务每分钟执行），仅管理员可用
+    """
+    return {"flushed_users": await flush_usage(request.app.state.redis)}
@@ -1,18 +1,259 @@
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
 from redis import Redis
 
-from app.api.ai_assist.utils.redis_memory import clear_chat_history
+from app.api.ai_assist.utils.redis_memory import save_turn
+from app.core.ai_scheduler import ai_bulkhead
+from app.core.cache import TwoLevelCache, hash_key
+from app.core.http_clients import get_http_client
+from app.core.usage_meter import record_usage
+from app.models import User
+from app.utils.compress import pack_json, unpack_json
+from app.utils.sse import sse_event
+from app.utils.textnorm import normalize_text
+from settings import settings
+
+ZJU_AI_URL = 'https://chat.zju.edu.cn/api/ai/v1/chat/completions'
+AI_API_KEY = settings.AI_ASSIST_KEY
+AI_MODEL = "deepseek-r1-671b"
+SYSTEM_PROMPT = "你是一位语言词典助手，回答要简洁、自然，适合初学者理解。只回答与词汇有关的问题。"
+
+# 首轮提问（没有聊天记录）的回答缓存，值为 {word, question, answer, model, created_at}
+ANSWER_CACHE_TTL = 7 * 86400
+answer_cache = TwoLevelCache(
+    namespace="ai_assist:answer",
+    local_maxsize=1024,
+    local_ttl=300,
+    redis_max_entries=50_000,
+)
+_QUESTION_TRAILING = " ?？!！。.~～"
+
+# 高频词的离线预生成解释（scripts/pregen_ai_explanations.py），hash：词 → 压缩的 JSON
+PREGEN_KEY = "ai_assist:pregen"
+# 预生成解释使用的提问；提示词变化时修改版本号，脚本会重新生成全部条目
+PREGEN_QUESTION = "请解释这个词的意思和用法，并给出例句"
+PREGEN_PROMPT_VERSION = "v1"
+# 视为“解释这个词”的首轮提问（规范化后比较）
+EXPLAIN_QUESTIONS = (
+    "解释", "解释一下", "解释这个词", "解释一下这个词", "请解释这个词", "这个词是什么意思", "什么意思",
+    "是什么意思", "这个词怎么用", "怎么用", "意思和用法", "这个词的意思和用法", PREGEN_QUESTION,
+    "explain", "explain this word", "what does it mean",
+)
+
+
+def build_messages(history: List[Dict], word: str, question: str) -> List[Dict]:
+    prompt = (
+        f"用户正在学习词语「{word}」。"
+        f"请回答与该词相关的问题：{question}\n"
+    )
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+    ]
+    messages.extend(history)
+    messages.append(
+        {"role": "user", "content": prompt}
+    )
+    return messages
+
+
+def build_payload(messages: List[Dict], stream: bool) -> Dict:
+    return {
+        "model": AI_MODEL,
+        "messages": messages,
+        "stream": stream
+    }
+
+
+def request_headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {AI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+async def stream_cached_answer(redis: Redis, user_id: str, word: str, question: str, cached: Dict) -> AsyncIterator[str]:
+    # 只有首轮提问会命中回答缓存，历史为空
+    await save_turn(redis, user_id, word, question, cached["answer"])
+    yield sse_event("delta", {"content": cached["answer"]})
+    yield sse_event("done", {"word": word, "model": cached["model"], "tokens_used": 0, "cached": True})
+
+
+async def stream_word_exp(
+        redis: Redis,
+        user: User,
+        word: str,
+        question: str,
+        messages: List[Dict],
+        history: List[Dict],
+) -> AsyncIterator[str]:
+    """
+    转发上游（OpenAI 兼容的 SSE）的增量回答
+    只有收到 [DONE] 或 finish_reason 时才视为完整回答并写入聊天记录；
+    客户端断开时生成器被取消，不会执行到写入步骤
+    :param history: 本轮之前的聊天记录；为空即首轮提问，完整回答会写入回答缓存
+    """
+    user_id = str(user.id)
+    parts: List[str] = []
+    model = AI_MODEL
+    tokens_used: Optional[int] = None
+    completed = False
+
+    try:
+        async with ai_bulkhead.slot(user_id):
+            client = get_http_client("ai_assist")
+            async with client.stream(
+                    "POST",
+                    ZJU_AI_URL,
+                    json=build_payload(messages, stream=True),
+                    headers=request_headers(),
+            ) as resp:
+                if resp.status_code != 200:
+                    body = (await resp.aread()).decode("utf-8", errors="replace")
+                    yield sse_event("error", {"status": resp.status_code, "detail": body})
+                    return
+
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        completed = True
+                        break
+
+                    chunk = json.loads(data)
+                    model = chunk.get("model") or model
+                    if chunk.get("usage"):
+                        tokens_used = chunk["usage"].get("total_tokens")
+                    for choice in chunk.get("choices") or []:
+                        delta = choice.get("delta") or {}
+                        if delta.get("reasoning_content"):
+                            yield sse_event("reasoning", {"content": delta["reasoning_content"]})
+                        if delta.get("content"):
+                            parts.append(delta["content"])
+                            yield sse_event("delta", {"content": delta["content"]})
+                        if choice.get("finish_reason"):
+                            completed = True
+    except (httpx.HTTPError, ValueError) as e:
+        yield sse_event("error", {"status": 500, "detail": f"AI调用失败: {str(e)}"})
+        return
+    except HTTPException as e:
+        # 排队超时
+        yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        return
+
+    if not completed:
+        yield sse_event("error", {"status": 502, "detail": "AI回答未完整返回"})
+        return
+
+    answer = "".join(parts)
+    await save_turn(redis, user_id, word, question, answer)
+    await record_usage(redis, user_id, "ai_assist", tokens_used)
+    if not history:
+        await set_cached_answer(redis, word, question, answer, model)
+    yield sse_event("done", {"word": word, "model": model, "tokens_used": tokens_used, "cached": False})
+
+
+def normalize_question(question: str) -> str:
+    # 大小写、重音、空白归一，并去掉句末的问号、感叹号等
+    return normalize_text(question).rstrip(_QUESTION_TRAILING)
+
+
+def answer_cache_key(word: str, question: str) -> str:
+    return hash_key(word.strip(), normalize_question(question))
+
+
+async def get_cached_answer(redis: Redis, word: str, question: str) -> Optional[Dict]:
+    value, _ = await answer_cache.get(redis, answer_cache_key(word, question))
+    return value
+
+
+async def set_cached_answer(redis: Redis, word: str, question: str, answer: str, model: str) -> None:
+    if not answer.strip():
+        return
+    await answer_cache.set(
+        redis,
+        answer_cache_key(word, question),
+        {"word": word, "question": question, "answer": answer, "model": model, "created_at": int(time.time())},
+        ttl=ANSWER_CACHE_TTL,
+    )
+
+
+async def list_cached_answers(redis: Redis, offset: int, limit: int) -> Dict:
+    entries = await answer_cache.entries(redis, offset=offset, limit=limit)
+    return {
+        "size": await answer_cache.size(redis),
+        "items": [{"key": key, **value} for key, value, _ in entries],
+    }
+
+
+async def purge_cached_answers(redis: Redis, word: Optional[str] = None) -> int:
+    """
+    :param word: 只清除该词的缓存；为空时清空全部
+    """
+    if word is None:
+        return await answer_cache.clear(redis)
+
+    removed = 0
+    async for batch in answer_cache.scan(redis):
+        keys = [key for key, value in batch if value.get("word") == word]
+        removed += await answer_cache.delete_many(redis, keys)
+    return removed
+
+
+_explain_questions = None
+
+
+def is_explain_question(question: str) -> bool:
+    global _explain_questions
+    if _explain_questions is None:
+        _explain_questions = {normalize_question(q) for q in EXPLAIN_QUESTIONS}
+    return normalize_question(question) in _explain_questions
+
+
+def build_explain_messages(word: str, definitions: List[str]) -> List[Dict]:
+    """
+    预生成解释的提示词：附上词典中的释义，保证解释与词典一致
+    """
+    messages = build_messages([], word, PREGEN_QUESTION)
+    if definitions:
+        messages[-1]["content"] += "词典释义：\n" + "\n".join(definitions)
+    return messages
+
+
+async def get_pregenerated(redis: Redis, word: str) -> Optional[Dict]:
+    return unpack_json(await redis.hget(PREGEN_KEY, word))
+
 
-CHAT_TTL = 7200
+async def get_pregenerated_hashes(redis: Redis, words: List[str]) -> Dict[str, str]:
+    """
+    :return: {词: 生成时的释义哈希}，没有预生成解释的词不出现在结果中
+    """
+    if not words:
+        return {}
+    result = {}
+    for word, data in zip(words, await redis.hmget(PREGEN_KEY, words)):
+        entry = unpack_json(data)
+        if entry:
+            result[word] = entry.get("def_hash")
+    return result
 
 
-async def get_and_set_last_key(redis: Redis, word: str, user_id: str):
-    last_key = f"last_word:{user_id}"
-    last_word = await redis.get(last_key)
-    print(last_word)
+async def set_pregenerated(redis: Redis, word: str, entry: Dict) -> None:
+    await redis.hset(PREGEN_KEY, word, pack_json(entry))
 
-    # 如果上一次查的词和这次不同，就清空旧词的记录
-    if last_word and last_word != word:
-        await clear_chat_history(redis, user_id, last_word.decode())
 
-    # 更新当前词
-    await redis.set(last_key, word, ex=CHAT_TTL)
+async def get_first_turn_answer(redis: Redis, word: str, question: str) -> Optional[Dict]:
+    """
+    首轮提问可直接作答的回答：“解释这个词”类提问优先用离线预生成的解释，其次查回答缓存
+    :return: {"answer", "model", ...}；都没有时返回 None
+    """
+    if is_explain_question(question):
+        entry = await get_pregenerated(redis, word)
+        if entry is not None:
+            return entry
+    return await get_cached_answer(redis, word, question)
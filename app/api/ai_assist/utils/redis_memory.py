@@ -1,35 +1,103 @@
+"""
+AI 助手的聊天记录
+
+每个用户只保留当前词的最近几轮问答（换词即视为清空），整体存成一个 key：
+    chatmem:{user_id} -> "z1:" + base64(zlib(json({"word": ..., "messages": [...]})))
+读取一次 GET；写入时在 WATCH/MULTI 事务中重新读取、追加、SET（带 TTL），
+两次请求并发写入同一用户时，后提交的一方会基于最新内容重试，不会覆盖对方的消息。
+Redis 客户端开启了 decode_responses，压缩结果需要 base64 成文本；相比原来 ensure_ascii 的 JSON
+（每个汉字 6 字节），中文回答仍能省下一半以上的内存。
+"""
 import json
-from typing import List, Dict
+from typing import Dict, List, Optional
+
+from redis.exceptions import WatchError
+
+from app.utils.compress import pack_json, unpack_json
 
 MAX_HISTORY = 6  # 每个用户保留最近3轮 (user+assistant)
 CHAT_TTL = 7200
 
 
+def _memory_key(user_id: str) -> str:
+    return f"chatmem:{user_id}"
+
+
+def encode_memory(word: str, messages: List[Dict]) -> str:
+    return pack_json({"word": word, "messages": messages})
+
+
+def decode_memory(data: Optional[str]) -> Optional[Dict]:
+    return unpack_json(data)
+
+
 async def get_chat_history(redis, user_id: str, word: str) -> List[Dict]:
     """
-        从 Redis 获取历史消息
-        """
-    key = f"chat:{user_id}:{word}"
-    data = await redis.lrange(key, 0, -1)
-    messages = [json.loads(d) for d in data]
-    return messages[-MAX_HISTORY:]  # 仅返回最近N条
+    从 Redis 获取当前词的历史消息；上一次问的是别的词时返回空列表（下次写入时覆盖）
+    """
+    memory = decode_memory(await redis.get(_memory_key(user_id)))
+    if not memory or memory.get("word") != word:
+        return []
+    return memory["messages"][-MAX_HISTORY:]  # 仅返回最近N条
 
 
-async def save_message(redis, user_id: str, word: str, role: str, content: str):
+async def save_turn(redis, user_id: str, word: str, question: str, answer: str):
     """
-    保存单条消息到 Redis
+    保存一轮问答，一次 SET 同时写入消息和 TTL，不会出现只有提问没有回答的记录。
+    压缩后的内容无法在 Lua 中解开，因此用 WATCH/MULTI 乐观锁：写入前重新读取当前内容，
+    期间被其他请求改写则重试，追加始终基于最新的记录
     """
-    key = f"chat:{user_id}:{word}"
-    msg = msg = json.dumps({"role": role, "content": content})
-    await redis.rpush(key, msg)
-    # 限制总长度
-    await redis.ltrim(key, -MAX_HISTORY, -1)
-    await redis.expire(key, CHAT_TTL)
+    key = _memory_key(user_id)
+    turn = [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer},
+    ]
+    async with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(key)
+                memory = decode_memory(await pipe.get(key))
+                history = memory["messages"] if memory and memory.get("word") == word else []
+                messages = (history + turn)[-MAX_HISTORY:]
+                pipe.multi()
+                pipe.set(key, encode_memory(word, messages), ex=CHAT_TTL)
+                await pipe.execute()
+                return
+            except WatchError:
+                continue
 
 
 async def clear_chat_history(redis, user_id: str, word: str):
     """
         删除某个用户针对某个词汇的全部聊天记录
         """
-    key = f"chat:{user_id}:{word}"
-    await redis.delete(key)
+    key = _memory_key(user_id)
+    memory = decode_memory(await redis.get(key))
+    if memory and memory.get("word") == word:
+        await redis.delete(key)
+
+
+async def memory_usage(redis, user_id: str) -> Dict:
+    """
+    单个用户聊天记录占用的内存：Redis 实际占用（MEMORY USAGE）与压缩前的大小
+    """
+    key = _memory_key(user_id)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.get(key)
+        pipe.memory_usage(key)
+        pipe.ttl(key)
+        data, used, ttl = await pipe.execute()
+
+    memory = decode_memory(data)
+    if memory is None:
+        return {"word": None, "messages": 0, "redis_bytes": 0, "stored_bytes": 0, "raw_bytes": 0, "ttl": None}
+    raw_bytes = len(json.dumps(memory["messages"]).encode("utf-8"))
+    return {
+        "word": memory["word"],
+        "messages": len(memory["messages"]),
+        "redis_bytes": used or 0,
+        "stored_bytes": len(data),
+        # 原格式（每条消息一个 ensure_ascii 的 JSON）下的大小，便于对比
+        "raw_bytes": raw_bytes,
+        "ttl": ttl,
+    }
@@ -4,16 +4,30 @@
 from typing import Literal, Dict, Tuple
 
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from starlette.requests import Request
 
 from app.api.article_director import service
 from app.api.article_director.article_schemas import UserArticleRequest, UserQuery
+from app.core.ai_scheduler import ai_bulkhead
+from app.core.usage_meter import check_quota, record_usage
 from app.models import User
 from app.utils.security import get_current_user
+from app.utils.sse import SSE_HEADERS
 
 article_router = APIRouter()
 
 
+def _article_lang(lang: str) -> str:
+    match lang:
+        case "en-US":
+            return "英语"
+        case "fr-FR":
+            return "法语"
+        case _:
+            return "日语"
+
+
 @article_router.post("/article-director/article")
 async def article_director(
         request: Request,
@@ -31,16 +45,9 @@ async def article_director(
     redis = request.app.state.redis
     # print(upload_article)
 
-    match lang:
-        case "en-US":
-            article_lang = "英语"
-        case "fr-FR":
-            article_lang = "法语"
-        case _:
-            article_lang = "日语"
+    article_lang = _article_lang(lang)
 
     user_id = user[0].id
-    article = upload_article.content
 
     # 读取历史对话
     session = await service.get_session(redis_client=redis, user_id=user_id)
@@ -50,7 +57,9 @@ async def article_director(
     session.append({"role": "user", "content": user_prompt})
 
     # 调用 EduChat 模型
-    completion = service.chat_ecnu_request(session)
+    await check_quota(redis, user[0], "article")
+    completion = await service.chat_ecnu_request(session, user_id=str(user_id))
+    await record_usage(redis, str(user_id), "article", completion.usage.total_tokens if completion.usage else None)
 
     # 取出回答内容
     assistant_reply = completion.choices[0].message.content
@@ -65,11 +74,38 @@ async def article_director(
 
     return {
         "reply": assistant_reply,
-        "tokens": completion.usage.total_tokens,
+        "tokens": completion.usage.total_tokens if completion.usage else None,
         "conversation_length": len(session),
     }
 
 
+@article_router.post("/article-director/article/stream")
+async def article_director_stream(
+        request: Request,
+        upload_article: UserArticleRequest,
+        lang: Literal["en-US", "fr-FR", "ja-JP"] = "fr-FR",
+        user: Tuple[User, Dict] = Depends(get_current_user)
+):
+    """
+    /article-director/article 的流式版本（SSE），事件：reasoning / delta / done / error
+    回答完整结束后才写入会话
+    """
+    redis = request.app.state.redis
+    user_id = user[0].id
+
+    session = await service.get_session(redis_client=redis, user_id=user_id)
+    user_prompt = service.set_user_prompt(upload_article, article_lang=_article_lang(lang))
+    session.append({"role": "user", "content": user_prompt})
+
+    await check_quota(redis, user[0], "article")
+    ai_bulkhead.check_admission()
+    return StreamingResponse(
+        service.stream_session_reply(redis, user_id, session),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
 @article_router.post("/article-director/question", description="用户进一步询问")
 async def further_question(
         request: Request,
@@ -87,7 +123,9 @@ async def further_question(
     session.append({"role": "user", "content": user_prompt.query})
 
     # 调用 EduChat 模型
-    completion = service.chat_ecnu_request(session)
+    await check_quota(redis, user[0], "article")
+    completion = await service.chat_ecnu_request(session, user_id=str(user_id))
+    await record_usage(redis, str(user_id), "article", completion.usage.total_tokens if completion.usage else None)
 
     # 取出回答内容
     assistant_reply = completion.choices[0].message.content
@@ -100,10 +138,37 @@ async def further_question(
 
     return {
         "reply": assistant_reply,
-        "tokens": completion.usage.total_tokens,
+        "tokens": completion.usage.total_tokens if completion.usage else None,
         "conversation_length": len(session),
     }
 
+
+@article_router.post("/article-director/question/stream", description="用户进一步询问（流式）")
+async def further_question_stream(
+        request: Request,
+        user_prompt: UserQuery,
+        user: Tuple[User, Dict] = Depends(get_current_user)
+):
+    redis = request.app.state.redis
+    user_id = user[0].id
+
+    session = await service.get_session(redis_client=redis, user_id=user_id)
+    session.append({"role": "user", "content": user_prompt.query})
+
+    await check_quota(redis, user[0], "article")
+    ai_bulkhead.check_admission()
+    return StreamingResponse(
+        service.stream_session_reply(redis, user_id, session),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@article_router.get("/article-director/session", description="当前会话大小")
+async def session_info(request: Request, user: Tuple[User, Dict] = Depends(get_current_user)):
+    return await service.session_stats(request.app.state.redis, user[0].id)
+
+
 @article_router.post("/article-director/reset", description="重置上下文")
 async def reset_conversation(request: Request, user: Tuple[User, Dict] = Depends(get_current_user)):
     user_id = user[0].id
@@ -1,12 +1,27 @@
 import json
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
-from openai import OpenAI
+from fastapi import HTTPException
+from openai import AsyncOpenAI, OpenAIError
 from redis import Redis
 
 from app.api.article_director.article_schemas import UserArticleRequest
+from app.core.ai_scheduler import ai_bulkhead
+from app.core.http_clients import get_http_client
+from app.core.usage_meter import record_usage
+from app.utils.compress import pack_json, unpack_json
+from app.utils.sse import sse_event
 from settings import settings
 
+ECNU_BASE_URL = "https://chat.ecnu.edu.cn/open/api/v1"
+ECNU_MODEL = "educhat-r1"
+
+# 会话在 Redis 中保存 24 小时；除 system prompt 外，发送给上游的历史对话不超过该 token 预算
+SESSION_TTL = 86400
+SESSION_TOKEN_BUDGET = 6000
+SUMMARY_PREFIX = "【早期对话摘要】"
+SUMMARY_PROMPT = "请把下面这段作文指导对话压缩成不超过300字的摘要，保留作文的主要问题、已给出的修改建议和学生的追问要点。"
+
 SYSTEM_PROMPT = """
 # 背景
 你是一个人工智能助手，名字叫EduChat,是一个由华东师范大学开发的教育领域大语言模型。
@@ -26,23 +41,100 @@ EduChat你需要扮演一位经验丰富的语文老师，现在需要帮助一
 """
 
 
-def chat_ecnu_request(
+_ecnu_client: Optional[AsyncOpenAI] = None
+_ecnu_http_client = None
+
+
+def get_ecnu_client() -> AsyncOpenAI:
+    """AsyncOpenAI 客户端只创建一次，底层复用 ecnu 的共享连接池；连接池重建后随之重建"""
+    global _ecnu_client, _ecnu_http_client
+    http_client = get_http_client("ecnu")
+    if _ecnu_client is None or _ecnu_http_client is not http_client:
+        _ecnu_http_client = http_client
+        _ecnu_client = AsyncOpenAI(
+            api_key=settings.ECNU_TEACH_AI_KEY,
+            base_url=ECNU_BASE_URL,
+            http_client=http_client,
+        )
+    return _ecnu_client
+
+
+async def chat_ecnu_request(
         session: List[Dict[str, str]],
+        user_id: Optional[str] = None,
 ):
-    client = OpenAI(
-        api_key=settings.ECNU_TEACH_AI_KEY,
-        base_url="https://chat.ecnu.edu.cn/open/api/v1"
-    )
-    completion = client.chat.completions.create(
-        model="educhat-r1",
-        messages=session,
-        temperature=0.8,  # 保持创造性
-        top_p=0.9,  # 保持多样性
-    )
+    # 与 AI 助手共用舱壁：全局并发上限 + 按用户公平排队
+    async with ai_bulkhead.slot(user_id):
+        completion = await get_ecnu_client().chat.completions.create(
+            model=ECNU_MODEL,
+            messages=session,
+            temperature=0.8,  # 保持创造性
+            top_p=0.9,  # 保持多样性
+        )
 
     return completion
 
 
+async def stream_ecnu_request(session: List[Dict[str, str]], user_id: Optional[str] = None):
+    """
+    流式调用，逐个产出 ChatCompletionChunk；整个流期间占用一个并发名额
+    """
+    async with ai_bulkhead.slot(user_id):
+        stream = await get_ecnu_client().chat.completions.create(
+            model=ECNU_MODEL,
+            messages=session,
+            temperature=0.8,
+            top_p=0.9,
+            stream=True,
+        )
+        # 客户端中途断开时关闭上游响应，连接归还连接池
+        async with stream:
+            async for chunk in stream:
+                yield chunk
+
+
+async def stream_session_reply(redis: Redis, user_id: str, session: List[Dict[str, str]]) -> AsyncIterator[str]:
+    """
+    把上游的增量回答转成 SSE：reasoning / delta / done / error
+    回答完整结束后才把本轮问答写回会话，中途断开或出错不改动会话
+    :param session: 已追加本轮用户输入的会话
+    """
+    parts: List[str] = []
+    tokens: Optional[int] = None
+    completed = False
+    try:
+        async for chunk in stream_ecnu_request(session, user_id=str(user_id)):
+            if chunk.usage:
+                tokens = chunk.usage.total_tokens
+            for choice in chunk.choices:
+                delta = choice.delta
+                reasoning = getattr(delta, "reasoning_content", None) if delta else None
+                if reasoning:
+                    yield sse_event("reasoning", {"content": reasoning})
+                if delta and delta.content:
+                    parts.append(delta.content)
+                    yield sse_event("delta", {"content": delta.content})
+                if choice.finish_reason:
+                    completed = True
+    except OpenAIError as e:
+        yield sse_event("error", {"status": 500, "detail": f"EduChat调用失败: {str(e)}"})
+        return
+    except HTTPException as e:
+        # 排队超时
+        yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        return
+
+    if not completed:
+        yield sse_event("error", {"status": 502, "detail": "EduChat回答未完整返回"})
+        return
+
+    await record_usage(redis, str(user_id), "article", tokens)
+    assistant_reply = await reply_process("".join(parts))
+    session.append({"role": "assistant", "content": assistant_reply})
+    await save_session(redis, user_id, session)
+    yield sse_event("done", {"tokens": tokens, "conversation_length": len(session)})
+
+
 def set_user_prompt(user_article: UserArticleRequest, article_lang: str):
     if user_article.theme is not None:
         user_prompt = f"以下是我的{article_lang}作文，作文体裁为{user_article.article_type}，标题为{user_article.theme}, 请帮我修改：{user_article.content}"
@@ -52,19 +144,141 @@ def set_user_prompt(user_article: UserArticleRequest, article_lang: str):
     return user_prompt
 
 
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：汉字、假名等每字约 1 个 token，其余字符约 4 个一个 token
+    只用于控制上下文长度，不追求精确
+    """
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    # 每条消息另有角色等格式开销
+    return estimate_tokens(message["content"]) + 4
+
+
+def _summary_message(summary: str) -> Dict[str, str]:
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+
+def _split_session(session: List[Dict[str, str]]) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """
+    把完整会话拆成（早期对话摘要, 对话轮次），去掉固定的 system prompt
+    """
+    summary = None
+    turns = []
+    for message in session:
+        if message["role"] == "system":
+            if message["content"].startswith(SUMMARY_PREFIX):
+                summary = message["content"][len(SUMMARY_PREFIX):]
+            continue
+        turns.append(message)
+    return summary, turns
+
+
+def fit_token_budget(
+        turns: List[Dict[str, str]],
+        budget: int = SESSION_TOKEN_BUDGET,
+) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    滑动窗口：保留第一条用户消息（作文原文）和预算内最近的若干轮，按 user+assistant 成对取舍
+    :return: (保留的消息, 被移出窗口的消息)
+    """
+    if sum(message_tokens(m) for m in turns) <= budget:
+        return turns, []
+
+    pinned = turns[:1] if turns and turns[0]["role"] == "user" else []
+    rest = turns[len(pinned):]
+    remaining = budget - sum(message_tokens(m) for m in pinned)
+
+    start = len(rest)
+    # 从末尾按两条一组往前取，最后一组（本轮问答）无论预算都保留
+    while start > 0:
+        group_start = max(start - 2, 0)
+        cost = sum(message_tokens(m) for m in rest[group_start:start])
+        if cost > remaining and start < len(rest):
+            break
+        remaining -= cost
+        start = group_start
+    return pinned + rest[start:], rest[:start]
+
+
+async def summarize_turns(
+        previous: Optional[str],
+        dropped: List[Dict[str, str]],
+        user_id: Optional[str] = None,
+) -> Optional[str]:
+    """
+    把移出窗口的对话（连同已有摘要）压缩成一段摘要；调用失败时返回原摘要
+    """
+    transcript = "\n".join(
+        f"{'学生' if m['role'] == 'user' else '老师'}：{m['content']}" for m in dropped
+    )
+    if previous:
+        transcript = f"已有摘要：{previous}\n{transcript}"
+    try:
+        completion = await chat_ecnu_request([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ], user_id=user_id)
+    except (OpenAIError, HTTPException):
+        return previous
+    return completion.choices[0].message.content or previous
+
+
 async def get_session(redis_client: Redis, user_id: str) -> List[Dict[str, str]]:
-    """从 Redis 读取对话上下文"""
+    """
+    从 Redis 读取对话上下文，返回可直接发送给上游的消息列表：
+    system prompt +（早期对话摘要）+ 预算内的对话轮次
+    """
     data = await redis_client.get(f"session:{user_id}")
-    if data:
-        return json.loads(data)
-    else:
-        # 如果没有记录，创建带 system prompt 的初始会话
-        return [{"role": "system", "content": SYSTEM_PROMPT},]
+    state = unpack_json(data)
+    if state is None and data:
+        # 兼容旧格式：完整会话的明文 JSON
+        state = dict(zip(("summary", "turns"), _split_session(json.loads(data))))
+
+    # 如果没有记录，创建带 system prompt 的初始会话
+    session = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if state:
+        if state.get("summary"):
+            session.append(_summary_message(state["summary"]))
+        session.extend(state["turns"])
+    return session
 
 
 async def save_session(redis_client: Redis, user_id: str, session: List[Dict[str, str]]):
-    """保存对话上下文到 Redis"""
-    await redis_client.setex(f"session:{user_id}", 86400, json.dumps(session))
+    """
+    保存对话上下文到 Redis：不保存固定的 system prompt，超出 token 预算的早期轮次移出窗口
+    （开启 ARTICLE_SESSION_SUMMARIZE 时并入摘要），整体压缩后存储
+    """
+    summary, turns = _split_session(session)
+    turns, dropped = fit_token_budget(turns)
+    if dropped and settings.ARTICLE_SESSION_SUMMARIZE:
+        summary = await summarize_turns(summary, dropped, user_id=str(user_id))
+    await redis_client.setex(
+        f"session:{user_id}",
+        SESSION_TTL,
+        pack_json({"summary": summary, "turns": turns}),
+    )
+
+
+async def session_stats(redis_client: Redis, user_id: str) -> Dict:
+    """
+    当前会话的大小：发送给上游的估算 token 数与 Redis 中的存储字节数
+    """
+    key = f"session:{user_id}"
+    data = await redis_client.get(key)
+    session = await get_session(redis_client, user_id)
+    summary, turns = _split_session(session)
+    return {
+        "turns": len(turns),
+        "has_summary": summary is not None,
+        "estimated_tokens": sum(message_tokens(m) for m in session),
+        "history_tokens": sum(message_tokens(m) for m in turns),
+        "token_budget": SESSION_TOKEN_BUDGET,
+        "stored_bytes": len(data) if data else 0,
+    }
 
 
 async def reset_session(redis_client: Redis, user_id: str):
@@ -0,0 +1,390 @@
+"""
+发音测评的音频转码
+
+上传的录音直接经 ffmpeg 的 stdin/stdout 转成 Azure 要求的 16 kHz / 单声道 / 16-bit PCM WAV，不再写入、回读临时文件：
+- ffmpeg 本身就是独立进程，用 asyncio 子进程驱动即可不阻塞事件循环；同时运行的 ffmpeg 进程数由信号量限制
+- 边读上传边写入 ffmpeg，上传超过 MAX_UPLOAD_BYTES 立即终止并返回 413
+- 输出按 PCM 字节数折算时长，超过 MAX_DURATION_SECONDS 立即终止并返回 413
+m4a/mp4 的 moov 可能位于文件末尾，解复用需要随机访问，无法从管道读取，这类文件仍先写入临时文件再转码。
+
+网页端上传的 WAV 不经过 ffmpeg：用 wave 解析 RIFF 头，NumPy 向量化地混音、重采样到 16 kHz；
+已经是 16 kHz 单声道 16-bit 的直接使用。只有 mp3/aac/m4a 等压缩格式、wave 无法解析的 WAV（如浮点 PCM），
+以及非 16-bit 的 WAV（24-bit 时 ffmpeg 实测更快，见 prefers_ffmpeg）走 ffmpeg。
+
+转码后、测评前再做一次预处理（preprocess_wav）：按帧能量检测语音，裁掉首尾静音，
+没有语音或有效语音过长的录音直接拒绝并说明原因，不再为 Azure 返回 NoMatch 的调用付费。
+"""
+import asyncio
+import os
+import tempfile
+import wave
+from io import BytesIO
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException, UploadFile
+from imageio_ffmpeg import get_ffmpeg_exe
+
+TARGET_RATE = 16000
+TARGET_CHANNELS = 1
+TARGET_WIDTH = 2
+BYTES_PER_SECOND = TARGET_RATE * TARGET_CHANNELS * TARGET_WIDTH
+
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_DURATION_SECONDS = 60
+TRANSCODE_CONCURRENCY = max(os.cpu_count() or 1, 2)
+TRANSCODE_TIMEOUT = 30
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# 语音检测（按帧能量）
+VAD_FRAME_MS = 20
+# 帧能量低于最响帧 VAD_DYNAMIC_RANGE_DB 以下、或低于 VAD_SILENCE_DBFS 的视为静音
+VAD_DYNAMIC_RANGE_DB = 35
+VAD_SILENCE_DBFS = -45
+# 连续 VAD_MIN_RUN 帧有声才算语音，避免孤立的按键声、爆音阻止裁剪
+VAD_MIN_RUN = 3
+# 裁剪后首尾各保留的静音，避免切掉弱起的辅音
+VAD_PAD_MS = 200
+MIN_SPEECH_SECONDS = 0.3
+# recognize_once 单次最多识别约 30 秒语音，更长的部分不会被测评
+MAX_SPEECH_SECONDS = 30
+# 满幅采样点占比超过该值视为削波（只提示，不拒绝）
+CLIP_RATIO = 0.01
+
+# 需要随机访问的容器，不能从管道读取
+SEEKABLE_SUFFIXES = {".m4a", ".mp4"}
+
+_ffmpeg_exe: Optional[str] = None
+_transcode_slots: Optional[asyncio.Semaphore] = None
+
+
+def ffmpeg_exe() -> str:
+    global _ffmpeg_exe
+    if _ffmpeg_exe is None:
+        _ffmpeg_exe = get_ffmpeg_exe()
+    return _ffmpeg_exe
+
+
+def _slots() -> asyncio.Semaphore:
+    global _transcode_slots
+    if _transcode_slots is None:
+        _transcode_slots = asyncio.Semaphore(TRANSCODE_CONCURRENCY)
+    return _transcode_slots
+
+
+def _ffmpeg_args(source: str, max_seconds: float) -> List[str]:
+    return [
+        ffmpeg_exe(), "-hide_banner", "-loglevel", "error",
+        "-i", source,
+        # 多截 1 秒，用于判断是否超长
+        "-t", str(max_seconds + 1),
+        "-vn",
+        "-ac", str(TARGET_CHANNELS),
+        "-ar", str(TARGET_RATE),
+        "-sample_fmt", "s16",
+        "-f", "s16le",
+        "pipe:1",
+    ]
+
+
+def too_large(limit: int = MAX_UPLOAD_BYTES) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Audio file too large (max {limit / 1024 / 1024:g} MB)")
+
+
+def too_long(max_seconds: float = MAX_DURATION_SECONDS) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Audio too long (max {max_seconds:g}s)")
+
+
+def pcm_to_wav(pcm: bytes, rate: int = TARGET_RATE, channels: int = TARGET_CHANNELS, width: int = TARGET_WIDTH) -> bytes:
+    """给裸 PCM 加上 44 字节的 RIFF/WAVE 头"""
+    byte_rate = rate * channels * width
+    header = b"".join([
+        b"RIFF", (36 + len(pcm)).to_bytes(4, "little"), b"WAVE",
+        b"fmt ", (16).to_bytes(4, "little"), (1).to_bytes(2, "little"), channels.to_bytes(2, "little"),
+        rate.to_bytes(4, "little"), byte_rate.to_bytes(4, "little"),
+        (channels * width).to_bytes(2, "little"), (width * 8).to_bytes(2, "little"),
+        b"data", len(pcm).to_bytes(4, "little"),
+    ])
+    return header + pcm
+
+
+def wav_pcm(wav: bytes) -> bytes:
+    """取出 16 kHz 单声道 16-bit WAV 中的 PCM 数据"""
+    with wave.open(BytesIO(wav), "rb") as wf:
+        if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) != (TARGET_RATE, TARGET_CHANNELS, TARGET_WIDTH):
+            raise HTTPException(status_code=415, detail="Invalid audio format")
+        return wf.readframes(wf.getnframes())
+
+
+def pcm_to_float(frames: bytes, width: int, channels: int) -> np.ndarray:
+    """
+    把 PCM 帧解码为 [-1, 1) 的 float32 数组，形状 (帧数, 声道数)
+    支持 8-bit（无符号）、16/24/32-bit（有符号，小端）
+    """
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        # 低 24 位拼成整数后左移 8 位，借助 int32 的符号位完成符号扩展
+        ints = (raw[:, 0] << 8 | raw[:, 1] << 16 | raw[:, 2] << 24)
+        samples = ints.astype(np.float32) / 2147483648
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {width}")
+    return samples.reshape(-1, channels)
+
+
+def resample(signal: np.ndarray, rate: int, target_rate: int = TARGET_RATE) -> np.ndarray:
+    """
+    频域重采样：rfft 后截断（或补零）到目标长度的频点，再 irfft
+    等价于理想低通 + 重采样，降采样时不会混叠
+    """
+    if rate == target_rate or len(signal) == 0:
+        return signal
+    n = len(signal)
+    n_out = max(int(round(n * target_rate / rate)), 1)
+    spectrum = np.fft.rfft(signal.astype(np.float64))
+    bins = n_out // 2 + 1
+    if len(spectrum) >= bins:
+        spectrum = spectrum[:bins]
+    else:
+        spectrum = np.concatenate([spectrum, np.zeros(bins - len(spectrum), dtype=spectrum.dtype)])
+    return (np.fft.irfft(spectrum, n_out) * (n_out / n)).astype(np.float32)
+
+
+def float_to_pcm16(signal: np.ndarray) -> bytes:
+    return np.clip(np.round(signal * 32768), -32768, 32767).astype("<i2").tobytes()
+
+
+def prefers_ffmpeg(rate: int, channels: int, width: int) -> bool:
+    """
+    NumPy 快速路径比 ffmpeg 慢的 WAV：只有非 16-bit 的输入（需要逐字节拆 24-bit 采样）
+    （scripts/bench_wav_fast_path：48 kHz 双声道 24-bit 10 秒，NumPy 约 37 ms，ffmpeg 约 21 ms；
+    16-bit 双声道 44.1/48 kHz 则是 NumPy 约快一倍）
+    """
+    return width != TARGET_WIDTH
+
+
+def normalize_wav(data: bytes, max_seconds: float = MAX_DURATION_SECONDS, force: bool = False) -> Optional[bytes]:
+    """
+    WAV 快速路径：混音为单声道并重采样到 16 kHz
+    :param force: 非 16-bit 输入也走 NumPy（仅用于基准对比）
+    :return: 规范化后的 WAV；wave 无法解析（非整数 PCM 等）或非 16-bit 时返回 None，交给 ffmpeg
+    """
+    try:
+        with wave.open(BytesIO(data), "rb") as wf:
+            rate, channels, width = wf.getframerate(), wf.getnchannels(), wf.getsampwidth()
+            n_frames = wf.getnframes()
+            if n_frames / rate > max_seconds:
+                raise too_long(max_seconds)
+            if not force and prefers_ffmpeg(rate, channels, width):
+                return None
+            frames = wf.readframes(n_frames)
+    except (wave.Error, EOFError):
+        return None
+
+    if (rate, channels, width) == (TARGET_RATE, TARGET_CHANNELS, TARGET_WIDTH):
+        return pcm_to_wav(frames)
+
+    try:
+        samples = pcm_to_float(frames, width, channels)
+    except ValueError:
+        return None
+    mono = samples.mean(axis=1) if channels > 1 else samples[:, 0]
+    return pcm_to_wav(float_to_pcm16(resample(mono, rate)))
+
+
+def rejected(status_code: int, reason: str, message: str, report: Dict[str, Any]) -> HTTPException:
+    """预处理拒绝录音：detail 中带上原因代码，便于客户端提示用户"""
+    return HTTPException(status_code=status_code, detail={"reason": reason, "message": message, **report})
+
+
+def detect_speech(samples: np.ndarray) -> Tuple[Optional[int], Optional[int]]:
+    """
+    按帧能量检测语音
+    :param samples: [-1, 1) 的单声道 float32 采样
+    :return: 语音起止的采样下标 (start, end)；没有语音时为 (None, None)
+    """
+    frame = TARGET_RATE * VAD_FRAME_MS // 1000
+    n_frames = len(samples) // frame
+    if n_frames < VAD_MIN_RUN:
+        return None, None
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-12)
+    threshold = max(VAD_SILENCE_DBFS, float(db.max()) - VAD_DYNAMIC_RANGE_DB)
+    voiced = (db > threshold).astype(np.int32)
+    # 只保留连续 VAD_MIN_RUN 帧以上的有声段（腐蚀掉的边缘由 VAD_PAD_MS 补回）
+    sustained = np.flatnonzero(np.convolve(voiced, np.ones(VAD_MIN_RUN, dtype=np.int32), "valid") == VAD_MIN_RUN)
+    if len(sustained) == 0:
+        return None, None
+    return int(sustained[0]) * frame, (int(sustained[-1]) + VAD_MIN_RUN) * frame
+
+
+def preprocess_wav(wav: bytes, max_speech_seconds: float = MAX_SPEECH_SECONDS) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    测评前的预处理：裁掉首尾静音，拒绝没有语音（422）或有效语音过长（413）的录音
+    :param wav: 16 kHz 单声道 16-bit PCM WAV
+    :return: (裁剪后的 WAV, 报告 {"duration", "speech_duration", "trimmed", "clipped", "clipped_ratio"})
+    """
+    ints = np.frombuffer(wav_pcm(wav), dtype="<i2")
+    clipped_ratio = float(np.mean((ints >= 32767) | (ints <= -32768))) if len(ints) else 0.0
+    report = {
+        "duration": round(len(ints) / TARGET_RATE, 2),
+        "clipped": clipped_ratio > CLIP_RATIO,
+        "clipped_ratio": round(clipped_ratio, 4),
+    }
+
+    start, end = detect_speech(ints.astype(np.float32) / 32768)
+    if start is None or (end - start) / TARGET_RATE < MIN_SPEECH_SECONDS:
+        raise rejected(422, "no_speech", "No speech detected in the recording", report)
+
+    pad = TARGET_RATE * VAD_PAD_MS // 1000
+    start, end = max(start - pad, 0), min(end + pad, len(ints))
+    report["speech_duration"] = round((end - start) / TARGET_RATE, 2)
+    report["trimmed"] = round(report["duration"] - report["speech_duration"], 2)
+    if report["speech_duration"] > max_speech_seconds:
+        raise rejected(413, "too_long", f"Speech too long (max {max_speech_seconds:g}s)", report)
+    return pcm_to_wav(ints[start:end].tobytes()), report
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """分块读取上传内容，超过 max_bytes 立即返回 413"""
+    data = bytearray()
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        data += chunk
+        if len(data) > max_bytes:
+            raise too_large(max_bytes)
+    return bytes(data)
+
+
+async def _upload_chunks(upload: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def _bytes_chunks(data: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), UPLOAD_CHUNK_SIZE):
+        yield data[start:start + UPLOAD_CHUNK_SIZE]
+
+
+async def _feed(proc: asyncio.subprocess.Process, chunks: AsyncIterator[bytes], max_bytes: int) -> None:
+    received = 0
+    try:
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > max_bytes:
+                raise too_large(max_bytes)
+            proc.stdin.write(chunk)
+            await proc.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg 提前退出（输入无法解码或已达到时长上限），错误由读取端处理
+        return
+    finally:
+        if proc.stdin and not proc.stdin.is_closing():
+            proc.stdin.close()
+
+
+async def _drain(proc: asyncio.subprocess.Process, max_seconds: float) -> bytes:
+    limit = int(max_seconds * BYTES_PER_SECOND)
+    pcm = bytearray()
+    while chunk := await proc.stdout.read(UPLOAD_CHUNK_SIZE):
+        pcm += chunk
+        if len(pcm) > limit:
+            raise too_long(max_seconds)
+    return bytes(pcm)
+
+
+async def _spool(upload: UploadFile, suffix: str, max_bytes: int) -> str:
+    data = await read_upload(upload, max_bytes)
+
+    def write() -> str:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            tmp.write(data)
+            return tmp.name
+
+    return await asyncio.to_thread(write)
+
+
+async def transcode_upload(
+        upload: UploadFile,
+        suffix: str,
+        max_bytes: int = MAX_UPLOAD_BYTES,
+        max_seconds: float = MAX_DURATION_SECONDS,
+) -> bytes:
+    """
+    把上传的录音转成 16 kHz 单声道 16-bit PCM WAV
+    :param suffix: 上传文件的扩展名（含点）
+    :return: 完整的 WAV 字节
+    """
+    if suffix == ".wav":
+        data = await read_upload(upload, max_bytes)
+        async with _slots():
+            wav = await asyncio.to_thread(normalize_wav, data, max_seconds)
+            if wav is not None:
+                return wav
+            return await _run_ffmpeg(_bytes_chunks(data), None, max_bytes, max_seconds)
+
+    src_path = await _spool(upload, suffix, max_bytes) if suffix in SEEKABLE_SUFFIXES else None
+    try:
+        async with _slots():
+            return await _run_ffmpeg(_upload_chunks(upload), src_path, max_bytes, max_seconds)
+    finally:
+        if src_path:
+            os.remove(src_path)
+
+
+async def prepare_upload(upload: UploadFile, suffix: str) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    转码并做静音裁剪；两步都在转码名额内执行，CPU 密集的工作总量受 TRANSCODE_CONCURRENCY 限制
+    :return: (裁剪后的 WAV, 预处理报告)
+    """
+    wav = await transcode_upload(upload, suffix)
+    async with _slots():
+        return await asyncio.to_thread(preprocess_wav, wav)
+
+
+async def _run_ffmpeg(
+        chunks: AsyncIterator[bytes],
+        src_path: Optional[str],
+        max_bytes: int,
+        max_seconds: float,
+) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *_ffmpeg_args(src_path or "pipe:0", max_seconds),
+        stdin=asyncio.subprocess.DEVNULL if src_path else asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    feed_task = asyncio.create_task(_feed(proc, chunks, max_bytes)) if not src_path else None
+    try:
+        pcm = await asyncio.wait_for(_drain(proc, max_seconds), timeout=TRANSCODE_TIMEOUT)
+        if feed_task:
+            await feed_task
+        returncode = await proc.wait()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Audio conversion timed out")
+    except HTTPException:
+        # 超长时立即终止 ffmpeg；上传超大时以 feed_task 的 413 为准
+        if feed_task and feed_task.done() and not feed_task.cancelled() and feed_task.exception():
+            raise feed_task.exception()
+        raise
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if feed_task:
+            feed_task.cancel()
+            await asyncio.gather(feed_task, return_exceptions=True)
+        stderr = await stderr_task
+
+    if returncode != 0 or not pcm:
+        message = stderr.decode("utf-8", errors="replace").strip().splitlines()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Audio conversion failed: {message[-1] if message else 'empty output'}",
+        )
+    return pcm_to_wav(pcm)
@@ -1,40 +1,137 @@
+import asyncio
 import json
 import os
-import random
-import tempfile
-from typing import Literal, Tuple, Dict
+from typing import Dict, List, Literal, Optional, Tuple
 
-import azure.cognitiveservices.speech as speechsdk
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, Query
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, Query, Response, WebSocket, WebSocketDisconnect
 from starlette.requests import Request
 
-from app.api.pronounciation_test import service
-from app.models import PronunciationTestFr, User, PronunciationTestJp
-from app.utils.security import get_current_user
-from settings import settings
+from app.api.pronounciation_test import audio, sentence_bank, service
+from app.api.pronounciation_test.scorer import AssessmentPool, get_assessment_pool
+from app.core.rate_limit import enforce, hit, rate_limit
+from app.models import User
+from app.utils.security import get_current_user, get_websocket_user, is_admin_user
 
 pron_test_router = APIRouter()
 
-AZURE_KEY = settings.AZURE_SUBSCRIPTION_KEY
-SERVICE_REGION = "eastasia"
 SUPPORTED_AUDIO_SUFFIXES = {".wav", ".mp3", ".aac", ".m4a"}
+MAX_BATCH_RECORDS = 20
+# 单个批量请求同时转码、裁剪的录音数，避免一个请求占满全局转码名额
+BATCH_PREPARE_CONCURRENCY = 4
 
-speech_config = speechsdk.SpeechConfig(subscription=AZURE_KEY, region=SERVICE_REGION)
-audio_config = speechsdk.audio.AudioConfig(filename="test.wav")
+
+def _audio_suffix(record: UploadFile, audio_format: str) -> str:
+    suffix = os.path.splitext(record.filename or "")[1].lower()
+    if not suffix and audio_format:
+        suffix = f".{audio_format.lstrip('.').lower()}"
+    if suffix not in SUPPORTED_AUDIO_SUFFIXES:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Invalid audio suffix, supported: {', '.join(sorted(SUPPORTED_AUDIO_SUFFIXES))}"
+        )
+    return suffix
 
 
-def _get_pronunciation_model(lang: Literal["fr-FR", "ja-JP"]):
-    if lang == "fr-FR":
-        return PronunciationTestFr
-    if lang == "ja-JP":
-        return PronunciationTestJp
-    raise HTTPException(status_code=400, detail="Unsupported language code")
+async def _read_socket(websocket: WebSocket, inbox: asyncio.Queue) -> None:
+    """
+    WebSocket 上的消息统一由这里读取后放入 inbox：二进制帧为 bytes，文本帧解析为 dict；连接断开时放入 None
+    """
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                inbox.put_nowait(message["bytes"])
+            elif message.get("text") is not None:
+                try:
+                    inbox.put_nowait(json.loads(message["text"]))
+                except ValueError:
+                    inbox.put_nowait({"type": "invalid"})
+    finally:
+        inbox.put_nowait(None)
+
+
+async def _wait_for_start(inbox: asyncio.Queue) -> None:
+    while True:
+        message = await inbox.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        if isinstance(message, dict) and message.get("type") == "start":
+            return
+        # start 之前的音频帧（如上一句出分后客户端仍在发送的残留）直接丢弃
+
+
+async def _forward_events(websocket: WebSocket, events: asyncio.Queue) -> None:
+    while True:
+        await websocket.send_json(await events.get())
+
+
+async def _stream_round(websocket: WebSocket, inbox: asyncio.Queue, pool: AssessmentPool, text: str, lang: str) -> Dict:
+    """
+    一句话的流式测评：音频帧边收边写入测评后端，中间结果实时推送给客户端；
+    后端判定说话结束、客户端发送 end 或录音达到时长上限时出分
+    """
+    loop = asyncio.get_running_loop()
+    max_bytes = audio.MAX_DURATION_SECONDS * audio.BYTES_PER_SECOND
+    deadline = loop.time() + audio.MAX_DURATION_SECONDS + pool.timeout
+    received = 0
+
+    events = asyncio.Queue()
+    async with pool.stream(text, lang, events) as assessment:
+        forward = asyncio.create_task(_forward_events(websocket, events))
+        outcome = asyncio.create_task(assessment.result())
+        try:
+            while not outcome.done():
+                incoming = asyncio.create_task(inbox.get())
+                done, _ = await asyncio.wait(
+                    {outcome, incoming}, timeout=max(deadline - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if incoming not in done:
+                    incoming.cancel()
+                    if not done:
+                        pool.timeouts += 1
+                        raise HTTPException(status_code=504, detail="Pronunciation assessment timed out")
+                    break
+
+                message = incoming.result()
+                if message is None:
+                    raise WebSocketDisconnect()
+                if isinstance(message, bytes):
+                    received += len(message)
+                    if received <= max_bytes:
+                        assessment.write(message)
+                    else:
+                        # 超过时长上限：按已收到的音频出分
+                        assessment.end_audio()
+                elif message.get("type") == "end":
+                    assessment.end_audio()
+            return outcome.result()
+        finally:
+            forward.cancel()
+            outcome.cancel()
+
+
+async def _prepare_recording(record: UploadFile, suffix: str) -> Tuple[bytes, Dict]:
+    # 网页端 WAV 与小程序端 MP3/AAC 统一规范化为 16kHz 单声道 PCM，
+    # 再裁掉首尾静音；没有语音或语音过长的录音在这里被拒绝，不调用测评后端
+    return await audio.prepare_upload(record, suffix)
+
+
+async def _score_recording(
+        record: UploadFile, suffix: str, text: str, lang: str, prepare_slots: asyncio.Semaphore
+) -> Dict:
+    async with prepare_slots:
+        wav, report = await _prepare_recording(record, suffix)
+    result = await service.assess_pronunciation(wav, text, lang)
+    result["audio"] = report
+    return result
 
 
 @pron_test_router.get("/start")
 async def start_test(
         request: Request,
-        count: int = 20,
+        count: int = Query(20, ge=1, le=100),
         lang: Literal["fr-FR", "ja-JP"] = Query("fr-FR"),
         user: Tuple[User, Dict] = Depends(get_current_user)
 ):
@@ -60,22 +157,17 @@ async def start_test(
             "session": session
         }
 
-    # === 根据语言选择对应题库 ===
-    table = _get_pronunciation_model(lang)
-    total_count = await table.all().count()
+    # === 从对应语言的题库中随机抽题（Redis SRANDMEMBER，只会抽到存在的句子） ===
+    sentences = await sentence_bank.sample_sentences(redis, lang, count)
 
-    # === 随机抽取句子 ID ===
-    if total_count == 0:
-        raise HTTPException(status_code=404, detail=f"No test sentences found for {lang}")
-
-    selected = random.sample(range(1, total_count + 1), k=min(count, total_count))
-
-    # === 构建并保存会话 ===
+    # === 构建并保存会话，句子文本一并写入，后续不再按句查库 ===
     session = {
+        "id": service.new_session_id(),  # 成绩按会话 id 隔离
         "lang": lang,  # ← 新增语言字段
         "current_index": 0,
-        "sentence_ids": selected,
-        "total": len(selected),
+        "sentence_ids": [sentence["id"] for sentence in sentences],
+        "sentences": sentences,
+        "total": len(sentences),
     }
 
     await redis.set(key, json.dumps(session), ex=3600)
@@ -88,7 +180,7 @@ async def start_test(
     }
 
 
-@pron_test_router.post("/sentence_test")
+@pron_test_router.post("/sentence_test", dependencies=[Depends(rate_limit("pron_test"))])
 async def pron_sentence_test(
         request: Request,
         record: UploadFile = File(...),
@@ -113,6 +205,7 @@ async def pron_sentence_test(
         return {"ok": False, "error": "No active test session"}
 
     session = json.loads(data)
+    sentences = await sentence_bank.session_sentences(redis, session)
     sentence_ids = session["sentence_ids"]
     index = session["current_index"]
     session_lang = session["lang"]
@@ -125,51 +218,22 @@ async def pron_sentence_test(
         return {"ok": True, "finished": True, "message": "All sentences tested"}
 
     sentence_id = sentence_ids[index]
-    sentence_model = _get_pronunciation_model(session_lang)
-    sentence = await sentence_model.get_or_none(id=sentence_id)
-    if not sentence:
-        raise HTTPException(status_code=404, detail=f"Sentence {sentence_id} not found")
-    text = sentence.text
+    text = sentences[index]["text"]
 
-    suffix = os.path.splitext(record.filename or "")[1].lower()
-    if not suffix and audio_format:
-        suffix = f".{audio_format.lstrip('.').lower()}"
-    if suffix not in SUPPORTED_AUDIO_SUFFIXES:
-        raise HTTPException(
-            status_code=415,
-            detail=f"Invalid audio suffix, supported: {', '.join(sorted(SUPPORTED_AUDIO_SUFFIXES))}"
-        )
+    suffix = _audio_suffix(record, audio_format)
+    # 边读上传边规范化为 16kHz 单声道 PCM，并裁掉首尾静音
+    wav, report = await _prepare_recording(record, suffix)
 
-    src_path = ""
-    norm_path = ""
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(await record.read())
-            tmp.flush()
-            src_path = tmp.name
-
-        # 调用转换函数，将网页端 WAV 与小程序端 MP3/AAC 统一规范化。
-        norm_path = src_path + "_norm.wav"
-        result = service.convert_to_pcm16_mono_wav(src_path, norm_path)
-        if not result["ok"]:
-            raise HTTPException(status_code=400, detail=result["message"])
-
-        # 再验证格式
-        if not service.verify_audio_format(norm_path):
-            raise HTTPException(status_code=415, detail="Invalid audio format")
-
-        try:
-            result = service.assess_pronunciation(norm_path, text, session_lang)
-            if not result["ok"]:
-                raise HTTPException(status_code=400, detail=result)
-        except HTTPException:
-            return result
-        except Exception as e:
-            return {"ok": False, "error": str(e)}
-    finally:
-        for path in (norm_path, src_path):
-            if path and os.path.exists(path):
-                os.remove(path)
+        result = await service.assess_pronunciation(wav, text, session_lang)
+    except HTTPException:
+        # 测评超时（504）
+        raise
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    result["audio"] = report
+    if not result["ok"]:
+        return result
 
     await service.save_pron_result(
         redis=redis,
@@ -177,17 +241,190 @@ async def pron_sentence_test(
         sentence_id=sentence_id,
         text=text,
         scores=result,
-        expire=3600
+        expire=3600,
+        session_id=session.get("id"),
     )
 
-    session["current_index"] += 1
-    await redis.set(key, json.dumps(session), ex=3600)
+    # 原子推进进度；同一句的并发重试只会推进一次
+    new_index = await service.advance_session(redis, key, user_id, index, session_id=session.get("id"))
+    if new_index < 0:
+        new_index = index + 1
 
-    result["progress"] = f"{session['current_index']}/{len(sentence_ids)}"
+    result["progress"] = f"{new_index}/{len(sentence_ids)}"
 
     return {"ok": True, "data": result}
 
 
+@pron_test_router.post("/batch_test")
+async def pron_batch_test(
+        request: Request,
+        response: Response,
+        records: List[UploadFile] = File(...),
+        lang: Literal["fr-FR", "ja-JP"] = Form("fr-FR"),
+        audio_format: str = Form(""),
+        start_index: Optional[int] = Form(None),
+        user: Tuple[User, Dict] = Depends(get_current_user)
+):
+    """
+    批量提交离线录制的多句录音：第 i 个录音对应会话中第 current_index + i 句，
+    全部录音并发转码、测评（受全局测评并发上限约束），按顺序返回每句的成绩
+    :param start_index: 客户端录音时的 current_index；与会话不一致时返回 409，避免录音与句子错位
+    """
+    redis = request.app.state.redis
+    user_id = user[0].id
+
+    if len(records) > MAX_BATCH_RECORDS:
+        raise HTTPException(status_code=413, detail=f"Too many recordings (max {MAX_BATCH_RECORDS})")
+    await enforce(request, response, "pron_test", str(user_id), cost=len(records))
+
+    key = f"test_session:{user_id}"
+    data = await redis.get(key)
+    if not data:
+        return {"ok": False, "error": "No active test session"}
+
+    session = json.loads(data)
+    sentences = await sentence_bank.session_sentences(redis, session)
+    index = session["current_index"]
+    if lang != session["lang"]:
+        raise HTTPException(status_code=400, detail="Language does not match active test session")
+    if start_index is not None and start_index != index:
+        raise HTTPException(status_code=409, detail=f"Session is at sentence {index}, not {start_index}")
+    if index + len(records) > len(sentences):
+        raise HTTPException(status_code=400, detail=f"Only {len(sentences) - index} sentence(s) remaining")
+
+    suffixes = [_audio_suffix(record, audio_format) for record in records]
+    targets = sentences[index:index + len(records)]
+    prepare_slots = asyncio.Semaphore(BATCH_PREPARE_CONCURRENCY)
+
+    async def score(offset: int) -> Dict:
+        sentence = targets[offset]
+        item = {"index": index + offset, "id": sentence["id"]}
+        try:
+            result = await _score_recording(
+                records[offset], suffixes[offset], sentence["text"], session["lang"], prepare_slots
+            )
+        except HTTPException as e:
+            return {**item, "ok": False, "status": e.status_code, "error": e.detail}
+        except Exception as e:
+            return {**item, "ok": False, "error": str(e)}
+        if result["ok"]:
+            await service.save_pron_result(
+                redis=redis,
+                user_id=user_id,
+                sentence_id=sentence["id"],
+                text=sentence["text"],
+                scores=result,
+                expire=3600,
+                session_id=session.get("id"),
+            )
+        return {**item, **result}
+
+    results = await asyncio.gather(*(score(offset) for offset in range(len(records))))
+
+    # 推进到第一句没有成绩的句子；失败的句子需要重新提交
+    new_index = await service.advance_session(redis, key, user_id, index, session_id=session.get("id"))
+    if new_index < 0:
+        new_index = index
+
+    return {
+        "ok": True,
+        "data": {
+            "results": results,
+            "scored": sum(1 for item in results if item["ok"]),
+            "progress": f"{new_index}/{len(sentences)}",
+        },
+    }
+
+
+@pron_test_router.websocket("/stream")
+async def pron_stream_test(websocket: WebSocket):
+    """
+    实时流式测评：边说边上传，说完即出分。鉴权使用 ?token= 或 Authorization 头。
+    每一句的流程：
+        服务端 → {"type": "ready", "index", "total", "sentence", "format"}
+        客户端 → {"type": "start"}，随后发送二进制帧（16 kHz 单声道 s16le PCM），可选 {"type": "end"}
+        服务端 → 若干 {"type": "interim", ...}，最后 {"type": "final", "index", "data"}
+    成绩有效时保存并推进进度，随后下发下一句的 ready；全部完成时发送 {"type": "finished"} 并关闭连接。
+    出错时发送 {"type": "error", "status", "detail"}，客户端可重新 start 本句。
+    """
+    try:
+        user = await get_websocket_user(websocket)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+    await websocket.accept()
+
+    redis = websocket.app.state.redis
+    user_id = user[0].id
+    key = f"test_session:{user_id}"
+    pool = get_assessment_pool()
+
+    inbox = asyncio.Queue()
+    reader = asyncio.create_task(_read_socket(websocket, inbox))
+    try:
+        while True:
+            data = await redis.get(key)
+            if not data:
+                await websocket.send_json({"type": "error", "status": 404, "detail": "No active test session"})
+                break
+            session = json.loads(data)
+            sentences = await sentence_bank.session_sentences(redis, session)
+            index = session["current_index"]
+            if index >= len(sentences):
+                await websocket.send_json({"type": "finished", "message": "All sentences tested"})
+                break
+
+            sentence = sentences[index]
+            await websocket.send_json({
+                "type": "ready",
+                "index": index,
+                "total": len(sentences),
+                "sentence": sentence["text"],
+                "format": {"rate": audio.TARGET_RATE, "channels": audio.TARGET_CHANNELS, "width": audio.TARGET_WIDTH},
+            })
+            await _wait_for_start(inbox)
+
+            limited = await hit(redis, "pron_test", str(user_id))
+            if not limited.allowed:
+                await websocket.send_json({
+                    "type": "error", "status": 429, "detail": "Too many requests",
+                    "retry_after": max(limited.retry_after, 1),
+                })
+                continue
+
+            try:
+                result = await _stream_round(websocket, inbox, pool, sentence["text"], session["lang"])
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+                continue
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "status": 500, "detail": str(e)})
+                continue
+
+            if result["ok"]:
+                await service.save_pron_result(
+                    redis=redis,
+                    user_id=user_id,
+                    sentence_id=sentence["id"],
+                    text=sentence["text"],
+                    scores=result,
+                    expire=3600,
+                    session_id=session.get("id"),
+                )
+                new_index = await service.advance_session(redis, key, user_id, index, session_id=session.get("id"))
+                if new_index < 0:
+                    new_index = index + 1
+                result["progress"] = f"{new_index}/{len(sentences)}"
+            await websocket.send_json({"type": "final", "index": index, "data": result})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+
+
 @pron_test_router.get("/current_sentence")
 async def get_current_sentence(
         request: Request,
@@ -202,17 +439,11 @@ async def get_current_sentence(
         return {"ok": False, "error": "No active test session"}
 
     session = json.loads(data)
-    sentence_ids = session["sentence_ids"]
+    sentences = await sentence_bank.session_sentences(redis, session)
     index = session["current_index"]
-    session_lang = session["lang"]
-    if index >= len(sentence_ids):
+    if index >= len(sentences):
         return {"ok": True, "finished": True, "message": "All sentences tested"}
-    sentence_id = sentence_ids[index]
-    sentence_model = _get_pronunciation_model(session_lang)
-    sentence = await sentence_model.get_or_none(id=sentence_id)
-    if not sentence:
-        return {"ok": False, "error": "Sentence not found"}
-    text = sentence.text
+    text = sentences[index]["text"]
 
     return {
         "ok": True,
@@ -236,19 +467,7 @@ async def get_testlist(
         return {"ok": False, "error": "No active test session"}
 
     session = json.loads(data)
-    sentence_ids = session["sentence_ids"]
-    session_lang = session["lang"]
-    sentence_model = _get_pronunciation_model(session_lang)
-    sentences = []
-
-    for sentence_id in sentence_ids:
-        sentence = await sentence_model.get_or_none(id=sentence_id)
-        if not sentence:
-            raise HTTPException(status_code=404, detail=f"Sentence {sentence_id} not found")
-        text = sentence.text
-        sentences.append({"id": sentence_id, "text": text})
-
-    return sentences
+    return await sentence_bank.session_sentences(redis, session)
 
 
 @pron_test_router.post("/finish")
@@ -290,7 +509,7 @@ async def finish_test(
             }
 
         # 如果用户确认强制结束，则读取已完成部分成绩
-        result = await service.get_pron_result(redis, user_id, delete_after=True)
+        result = await service.get_pron_result(redis, user_id, delete_after=True, session_id=session.get("id"))
         await redis.delete(session_key)
 
         return {
@@ -301,7 +520,7 @@ async def finish_test(
         }
 
     # === 已完成测试 ===
-    result = await service.get_pron_result(redis, user_id, delete_after=True)
+    result = await service.get_pron_result(redis, user_id, delete_after=True, session_id=session.get("id"))
     if not result["ok"]:
         raise HTTPException(status_code=404, detail=result.get("error", "Unknown error"))
     # 删除 Redis session
@@ -326,8 +545,35 @@ async def clear_session(request: Request, user: Tuple[User, Dict] = Depends(get_
     user_id = user[0].id
 
     key = f"test_session:{user_id}"
-    await redis.delete(key)
+    data = await redis.get(key)
+    # 会话与其已保存的成绩一起清除
+    session_id = json.loads(data).get("id") if data else None
+    await service.clear_test_session(redis, key, user_id, session_id)
     return {
         "ok": True,
         "message": "Session cleared",
     }
+
+
+@pron_test_router.get("/assess/stats")
+async def assessment_stats(admin_user: Tuple[User, Dict] = Depends(is_admin_user)):
+    """
+    测评线程池的状态（当前 worker）：后端、并发上限、进行中与排队数、超时次数，仅管理员可用
+    """
+    return get_assessment_pool().stats()
+
+
+@pron_test_router.get("/bank")
+async def get_sentence_bank_sizes(request: Request, admin_user: Tuple[User, Dict] = Depends(is_admin_user)):
+    """
+    Redis 中各语言题库的句子数，仅管理员可用
+    """
+    return await sentence_bank.bank_sizes(request.app.state.redis)
+
+
+@pron_test_router.post("/bank/reload")
+async def reload_sentence_bank(request: Request, admin_user: Tuple[User, Dict] = Depends(is_admin_user)):
+    """
+    题库（PronunciationTestFr / PronunciationTestJp）更新后，从数据库重新加载到 Redis，仅管理员可用
+    """
+    return await sentence_bank.load_all_banks(request.app.state.redis)
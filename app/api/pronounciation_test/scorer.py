@@ -0,0 +1,440 @@
+"""
+发音测评后端
+
+Azure Speech SDK 的 recognize_once() 是阻塞调用，这里统一放到专用线程池执行：
+- 同时进行的测评数不超过 PRON_ASSESS_CONCURRENCY，超出的请求在协程中排队，不占用线程
+- 单次测评超过 PRON_ASSESS_TIMEOUT 秒返回 504
+- SpeechConfig 按语种缓存，只创建一次
+后端可替换：PRON_SCORER=fake 时使用本地打分替身，不调用 Azure，用于压测与本地开发。
+
+流式测评（WebSocket）：open_stream 返回一个 StreamingAssessment，边收音频边写入后端，
+后端识别出一句话结束时即给出最终成绩。Azure 使用 PushAudioInputStream + 事件回调，不占用线程；
+其他后端默认先缓存音频，音频结束后经 preprocess_wav 裁剪静音再调用 assess。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional
+
+import azure.cognitiveservices.speech as speechsdk
+from fastapi import HTTPException
+
+from app.api.pronounciation_test.audio import (
+    BYTES_PER_SECOND, TARGET_CHANNELS, TARGET_RATE, TARGET_WIDTH, pcm_to_wav, preprocess_wav, wav_pcm,
+)
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+AZURE_REGION = "eastasia"
+
+PronLang = Literal["fr-FR", "ja-JP"]
+
+
+# 在测评线程池中执行同步函数：run(func, *args)
+BlockingRunner = Callable[..., Awaitable[Any]]
+
+
+class StreamingAssessment(ABC):
+    """
+    一次流式测评：write 写入 16 kHz 单声道 16-bit PCM，end_audio 表示音频结束，
+    result 在后端判定一句话结束（或音频结束）后返回最终成绩；中间结果放入 events 队列
+    """
+
+    def __init__(self, events: asyncio.Queue):
+        self.events = events
+
+    @abstractmethod
+    def write(self, pcm: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def end_audio(self) -> None:
+        ...
+
+    @abstractmethod
+    async def result(self) -> Dict[str, Any]:
+        ...
+
+    def close(self) -> None:
+        """释放后端资源；result 完成前调用即为放弃本次测评"""
+
+
+class BufferedStreamingAssessment(StreamingAssessment):
+    """
+    不支持流式输入的后端：缓存音频，音频结束后整段交给 assess；每收到 1 秒音频推送一次进度
+    """
+
+    def __init__(self, scorer: "PronunciationScorer", reference_text: str, lang: PronLang,
+                 events: asyncio.Queue, run: BlockingRunner):
+        super().__init__(events)
+        self.scorer = scorer
+        self.reference_text = reference_text
+        self.lang = lang
+        self.run = run
+        self._chunks: List[bytes] = []
+        self._received = 0
+        self._ended = asyncio.Event()
+
+    def write(self, pcm: bytes) -> None:
+        before = self._received // BYTES_PER_SECOND
+        self._chunks.append(pcm)
+        self._received += len(pcm)
+        if self._received // BYTES_PER_SECOND > before:
+            self.events.put_nowait({"type": "interim", "received_seconds": round(self._received / BYTES_PER_SECOND, 2)})
+
+    def end_audio(self) -> None:
+        self._ended.set()
+
+    async def result(self) -> Dict[str, Any]:
+        await self._ended.wait()
+        # 整段音频已在手，与上传录音一样先裁掉静音；没有语音时直接拒绝
+        wav, report = await asyncio.to_thread(preprocess_wav, pcm_to_wav(b"".join(self._chunks)))
+        result = await self.run(self.scorer.assess, wav, self.reference_text, self.lang)
+        result["audio"] = report
+        return result
+
+
+class PronunciationScorer(ABC):
+    """
+    测评后端接口：assess 为同步方法，在线程池中执行
+    """
+    name = "base"
+    # open_stream 是否在说话期间就占用上游连接（实时推流）；否则只在出分时占用测评名额
+    live_streaming = False
+
+    @abstractmethod
+    def assess(self, wav: bytes, reference_text: str, lang: PronLang) -> Dict[str, Any]:
+        """
+        :param wav: 16 kHz 单声道 16-bit PCM WAV
+        :return: {"ok": True, "recognized_text", "overall_score", "accuracy", "fluency", "completeness"}
+                 或 {"ok": False, "error", ...}
+        """
+
+    def open_stream(self, reference_text: str, lang: PronLang, events: asyncio.Queue,
+                    run: BlockingRunner) -> StreamingAssessment:
+        return BufferedStreamingAssessment(self, reference_text, lang, events, run)
+
+
+class AzureScorer(PronunciationScorer):
+    name = "azure"
+    live_streaming = True
+
+    def __init__(
+            self,
+            subscription_key: str,
+            region: str = AZURE_REGION,
+            grading_system: Literal["HundredMark", "FivePoint"] = "FivePoint",
+            granularity: Literal["Phoneme", "Word", "FullText"] = "Phoneme",
+            enable_miscue: bool = True,
+    ):
+        if not subscription_key or not region:
+            raise RuntimeError("缺少 Azure Speech 环境变量 AZURE_SUBSCRIPTION_KEY")
+        self.subscription_key = subscription_key
+        self.region = region
+        self.grading_system = grading_system
+        self.granularity = granularity
+        self.enable_miscue = enable_miscue
+        self._configs: Dict[str, speechsdk.SpeechConfig] = {}
+
+    def speech_config(self, lang: str) -> speechsdk.SpeechConfig:
+        # 识别语种是 SpeechConfig 的属性，按语种各缓存一份；创建后只读，可在线程间共享
+        config = self._configs.get(lang)
+        if config is None:
+            config = speechsdk.SpeechConfig(subscription=self.subscription_key, region=self.region)
+            config.speech_recognition_language = lang
+            self._configs[lang] = config
+        return config
+
+    def assessment_config(self, reference_text: str) -> speechsdk.PronunciationAssessmentConfig:
+        return speechsdk.PronunciationAssessmentConfig(
+            reference_text=reference_text,
+            grading_system=getattr(speechsdk.PronunciationAssessmentGradingSystem, self.grading_system),
+            granularity=getattr(speechsdk.PronunciationAssessmentGranularity, self.granularity),
+            enable_miscue=self.enable_miscue,
+        )
+
+    @staticmethod
+    def stream_format() -> speechsdk.audio.AudioStreamFormat:
+        return speechsdk.audio.AudioStreamFormat(
+            samples_per_second=TARGET_RATE, bits_per_sample=TARGET_WIDTH * 8, channels=TARGET_CHANNELS,
+        )
+
+    def assess(self, wav: bytes, reference_text: str, lang: PronLang) -> Dict[str, Any]:
+        # 音频直接写入推流，不经过临时文件
+        stream = speechsdk.audio.PushAudioInputStream(stream_format=self.stream_format())
+        stream.write(wav_pcm(wav))
+        stream.close()
+
+        recognizer = speechsdk.SpeechRecognizer(
+            speech_config=self.speech_config(lang),
+            audio_config=speechsdk.audio.AudioConfig(stream=stream),
+        )
+        self.assessment_config(reference_text).apply_to(recognizer)
+        return parse_azure_result(recognizer.recognize_once())
+
+    def open_stream(self, reference_text: str, lang: PronLang, events: asyncio.Queue,
+                    run: BlockingRunner) -> StreamingAssessment:
+        return AzureStreamingAssessment(self, reference_text, lang, events)
+
+
+class AzureStreamingAssessment(StreamingAssessment):
+    """
+    音频边收边写入 PushAudioInputStream；recognize_once_async 在检测到一句话结束时给出结果。
+    SDK 的回调在其内部线程中执行，通过 call_soon_threadsafe 交回事件循环
+    """
+
+    def __init__(self, scorer: AzureScorer, reference_text: str, lang: PronLang, events: asyncio.Queue):
+        super().__init__(events)
+        self._loop = asyncio.get_running_loop()
+        self._result: asyncio.Future = self._loop.create_future()
+        self._stream = speechsdk.audio.PushAudioInputStream(stream_format=scorer.stream_format())
+        self._recognizer = speechsdk.SpeechRecognizer(
+            speech_config=scorer.speech_config(lang),
+            audio_config=speechsdk.audio.AudioConfig(stream=self._stream),
+        )
+        scorer.assessment_config(reference_text).apply_to(self._recognizer)
+        self._recognizer.recognizing.connect(self._on_recognizing)
+        self._recognizer.recognized.connect(lambda evt: self._resolve(parse_azure_result(evt.result)))
+        self._recognizer.canceled.connect(lambda evt: self._resolve(parse_azure_error(evt.result)))
+        self._audio_open = True
+        self._pending = self._recognizer.recognize_once_async()
+
+    def _on_recognizing(self, evt) -> None:
+        self._loop.call_soon_threadsafe(
+            self.events.put_nowait, {"type": "interim", "recognized_text": evt.result.text}
+        )
+
+    def _resolve(self, result: Dict[str, Any]) -> None:
+        def set_result():
+            if not self._result.done():
+                self._result.set_result(result)
+
+        self._loop.call_soon_threadsafe(set_result)
+
+    def write(self, pcm: bytes) -> None:
+        if self._audio_open:
+            self._stream.write(pcm)
+
+    def end_audio(self) -> None:
+        if self._audio_open:
+            self._audio_open = False
+            self._stream.close()
+
+    async def result(self) -> Dict[str, Any]:
+        return await self._result
+
+    def close(self) -> None:
+        # 关闭音频流后识别会随即结束，回调不再有等待者
+        self.end_audio()
+        for signal in (self._recognizer.recognizing, self._recognizer.recognized, self._recognizer.canceled):
+            signal.disconnect_all()
+
+
+def parse_azure_result(result: Any) -> Dict[str, Any]:
+    if result.reason != speechsdk.ResultReason.RecognizedSpeech:
+        return parse_azure_error(result)
+
+    data = json.loads(result.properties.get(speechsdk.PropertyId.SpeechServiceResponse_JsonResult))
+    pa_data = data["NBest"][0]["PronunciationAssessment"]
+    return {
+        "ok": True,
+        "recognized_text": data.get("DisplayText"),
+        "overall_score": pa_data.get("PronScore"),
+        "accuracy": pa_data.get("AccuracyScore"),
+        "fluency": pa_data.get("FluencyScore"),
+        "completeness": pa_data.get("CompletenessScore")
+    }
+
+
+def parse_azure_error(result: Any) -> Dict[str, Any]:
+    """
+    从 Azure Speech 识别结果中提取详细错误信息。
+    用于处理 ResultReason != RecognizedSpeech 的情况。
+    :param result: SpeechRecognizer 的识别结果对象
+    :return: 包含 ok=False 与详细错误字段的 dict
+    """
+    err_data = {
+        "ok": False,
+        "error": str(result.reason),
+        "details": getattr(result, "error_details", None)
+    }
+
+    # ① 无法识别语音（NoMatch）
+    if result.reason == speechsdk.ResultReason.NoMatch:
+        err_data["no_match_details"] = str(getattr(result, "no_match_details", None))
+        logger.warning("Azure NoMatch: speech could not be recognized: %s", err_data["no_match_details"])
+
+    # ② 请求被取消（Canceled）
+    elif result.reason == speechsdk.ResultReason.Canceled:
+        cancellation_details = getattr(result, "cancellation_details", None)
+        if cancellation_details:
+            err_data["cancel_reason"] = str(getattr(cancellation_details, "reason", None))
+            err_data["cancel_error_details"] = getattr(cancellation_details, "error_details", None)
+            err_data["cancel_error_code"] = getattr(cancellation_details, "error_code", None)
+            logger.error(
+                "Azure canceled by Speech Service: reason=%s code=%s details=%s",
+                err_data["cancel_reason"], err_data["cancel_error_code"], err_data["cancel_error_details"],
+            )
+        else:
+            logger.error("Azure canceled without details")
+
+    # ③ 其他未知类型
+    else:
+        logger.warning("Azure unexpected recognition result: %s, details=%s", result.reason, err_data["details"])
+
+    return err_data
+
+
+class FakeScorer(PronunciationScorer):
+    """
+    本地打分替身：分数由音频内容与参考文本的哈希决定（同样的输入得到同样的分数），
+    按录音时长乘以 latency_ratio 模拟 Azure 的处理耗时
+    """
+    name = "fake"
+
+    def __init__(self, latency_ratio: float = 0.3):
+        self.latency_ratio = latency_ratio
+
+    def assess(self, wav: bytes, reference_text: str, lang: PronLang) -> Dict[str, Any]:
+        pcm = wav_pcm(wav)
+        if not pcm:
+            return {"ok": False, "error": "ResultReason.NoMatch", "details": "empty audio"}
+        time.sleep(len(pcm) / BYTES_PER_SECOND * self.latency_ratio)
+
+        digest = hashlib.blake2b(pcm + reference_text.encode("utf-8"), digest_size=8).digest()
+        accuracy, fluency, completeness = (round(2.5 + b / 255 * 2.5, 1) for b in digest[:3])
+        return {
+            "ok": True,
+            "recognized_text": reference_text,
+            "overall_score": round((accuracy + fluency + completeness) / 3, 1),
+            "accuracy": accuracy,
+            "fluency": fluency,
+            "completeness": completeness,
+        }
+
+
+SCORERS = {
+    "azure": lambda: AzureScorer(settings.AZURE_SUBSCRIPTION_KEY),
+    "fake": FakeScorer,
+}
+
+
+class AssessmentPool:
+    """
+    在专用线程池中执行测评，限制并发并为每次调用设置超时
+    """
+
+    def __init__(self, scorer: PronunciationScorer, concurrency: int, timeout: float, stream_concurrency: int):
+        self.scorer = scorer
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.stream_concurrency = stream_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pron-assess")
+        self._slots = asyncio.Semaphore(concurrency)
+        self._stream_slots = asyncio.Semaphore(stream_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.streaming = 0
+        self.timeouts = 0
+
+    async def _acquire(self) -> None:
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def _release(self, future: Optional[asyncio.Future] = None) -> None:
+        if future is not None and not future.cancelled():
+            # 超时后线程仍会跑完，结果无人等待；取出异常避免 "exception was never retrieved"
+            future.exception()
+        self.active -= 1
+        self._slots.release()
+
+    async def _wait(self, future: asyncio.Future) -> Any:
+        # shield：超时或调用方被取消时只是不再等待，不取消 future，名额随线程结束才释放
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(status_code=504, detail="Pronunciation assessment timed out")
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        占用一个名额在测评线程池中执行，超过 timeout 返回 504。
+        超时后线程里的调用仍会跑完，因此名额由 future 完成时的回调释放；
+        名额数等于线程数，拿到名额即有空闲线程，超时从调用真正开始执行时计时
+        """
+        await self._acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return await self._wait(future)
+
+    async def assess(self, wav: bytes, reference_text: str, lang: PronLang) -> Dict[str, Any]:
+        return await self.run(self.scorer.assess, wav, reference_text, lang)
+
+    @asynccontextmanager
+    async def stream(self, reference_text: str, lang: PronLang, events: asyncio.Queue):
+        """
+        流式测评。缓存音频的后端在用户说话期间不占用测评名额，出分时才经 run 占用一个；
+        实时推流的后端（Azure）整个过程占用一个推流名额，推流名额与测评名额分开，
+        说话中的 WebSocket 用户不会挤占 HTTP 提交的测评
+        """
+        live = self.scorer.live_streaming
+        if live:
+            await self._stream_slots.acquire()
+            self.streaming += 1
+        assessment = None
+        try:
+            assessment = self.scorer.open_stream(reference_text, lang, events, self.run)
+            yield assessment
+        finally:
+            if assessment is not None:
+                assessment.close()
+            if live:
+                self.streaming -= 1
+                self._stream_slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.scorer.name,
+            "concurrency": self.concurrency,
+            "timeout": self.timeout,
+            "active": self.active,
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "stream_concurrency": self.stream_concurrency,
+            "streaming": self.streaming,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: Optional[AssessmentPool] = None
+
+
+def get_assessment_pool() -> AssessmentPool:
+    global _pool
+    if _pool is None:
+        factory = SCORERS.get(settings.PRON_SCORER)
+        if factory is None:
+            raise RuntimeError(f"Unknown PRON_SCORER: {settings.PRON_SCORER}")
+        _pool = AssessmentPool(
+            factory(),
+            concurrency=settings.PRON_ASSESS_CONCURRENCY,
+            timeout=settings.PRON_ASSESS_TIMEOUT,
+            stream_concurrency=settings.PRON_STREAM_CONCURRENCY,
+        )
+    return _pool
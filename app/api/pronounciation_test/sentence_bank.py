@@ -0,0 +1,115 @@
+"""
+发音测评题库
+
+每种语言的题库在 Redis 中保存两份结构：
+    pron_bank:{lang}:ids    SET   句子 ID，用 SRANDMEMBER 随机抽题（只会抽到真实存在的 ID）
+    pron_bank:{lang}:texts  HASH  句子 ID → 文本
+应用启动时从数据库加载；题库更新后调用管理员接口 /test/pron/bank/reload 重新加载，
+或 Redis 中题库丢失时在下一次抽题时自动加载。
+抽中的句子文本直接写入测评会话，整个测评过程不再按句查询数据库。
+"""
+from typing import Dict, List, Literal
+
+from fastapi import HTTPException
+from redis.asyncio import Redis
+
+from app.models import PronunciationTestFr, PronunciationTestJp
+
+PronLang = Literal["fr-FR", "ja-JP"]
+
+BANK_MODELS = {
+    "fr-FR": PronunciationTestFr,
+    "ja-JP": PronunciationTestJp,
+}
+
+
+def _ids_key(lang: str) -> str:
+    return f"pron_bank:{lang}:ids"
+
+
+def _texts_key(lang: str) -> str:
+    return f"pron_bank:{lang}:texts"
+
+
+def get_bank_model(lang: str):
+    model = BANK_MODELS.get(lang)
+    if model is None:
+        raise HTTPException(status_code=400, detail="Unsupported language code")
+    return model
+
+
+async def load_bank(redis: Redis, lang: PronLang) -> int:
+    """
+    从数据库重新加载题库：先写入临时 key，再用 RENAME 原子替换，加载期间抽题不受影响
+    :return: 题库句子数
+    """
+    rows = await get_bank_model(lang).all().values_list("id", "text")
+    ids_key, texts_key = _ids_key(lang), _texts_key(lang)
+    if not rows:
+        await redis.delete(ids_key, texts_key)
+        return 0
+
+    tmp_ids, tmp_texts = f"{ids_key}:loading", f"{texts_key}:loading"
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(tmp_ids, tmp_texts)
+        pipe.sadd(tmp_ids, *(sentence_id for sentence_id, _ in rows))
+        pipe.hset(tmp_texts, mapping={sentence_id: text for sentence_id, text in rows})
+        pipe.rename(tmp_ids, ids_key)
+        pipe.rename(tmp_texts, texts_key)
+        await pipe.execute()
+    return len(rows)
+
+
+async def load_all_banks(redis: Redis) -> Dict[str, int]:
+    return {lang: await load_bank(redis, lang) for lang in BANK_MODELS}
+
+
+async def bank_sizes(redis: Redis) -> Dict[str, int]:
+    async with redis.pipeline(transaction=False) as pipe:
+        for lang in BANK_MODELS:
+            pipe.scard(_ids_key(lang))
+        sizes = await pipe.execute()
+    return dict(zip(BANK_MODELS, sizes))
+
+
+async def sample_sentences(redis: Redis, lang: PronLang, count: int) -> List[Dict]:
+    """
+    随机抽取 count 个不重复的句子
+    :return: [{"id", "text"}, ...]
+    """
+    ids = await redis.srandmember(_ids_key(lang), count)
+    if not ids:
+        # 题库尚未加载或已被清除
+        await load_bank(redis, lang)
+        ids = await redis.srandmember(_ids_key(lang), count)
+    if not ids:
+        raise HTTPException(status_code=404, detail=f"No test sentences found for {lang}")
+    return await get_sentences(redis, lang, [int(sentence_id) for sentence_id in ids])
+
+
+async def get_sentences(redis: Redis, lang: PronLang, sentence_ids: List[int]) -> List[Dict]:
+    """
+    按 ID 读取句子文本，题库中缺失的句子回退到数据库
+    """
+    texts = await redis.hmget(_texts_key(lang), sentence_ids) if sentence_ids else []
+    missing = [sentence_id for sentence_id, text in zip(sentence_ids, texts) if text is None]
+    if missing:
+        found = dict(await get_bank_model(lang).filter(id__in=missing).values_list("id", "text"))
+        texts = [found.get(sentence_id) if text is None else text for sentence_id, text in zip(sentence_ids, texts)]
+    return [
+        {"id": sentence_id, "text": text}
+        for sentence_id, text in zip(sentence_ids, texts)
+        if text is not None
+    ]
+
+
+async def session_sentences(redis: Redis, session: Dict) -> List[Dict]:
+    """
+    会话中的句子列表；兼容只保存了 sentence_ids 的旧会话
+    """
+    sentences = session.get("sentences")
+    if sentences is None:
+        sentences = await get_sentences(redis, session["lang"], session["sentence_ids"])
+        session["sentences"] = sentences
+        session["sentence_ids"] = [sentence["id"] for sentence in sentences]
+    return sentences
@@ -1,22 +1,16 @@
 import contextlib
 import json
 import os
+import uuid
 import wave
-from io import BytesIO
-from typing import Literal, Dict, Any, List
+from typing import Literal, Dict, Any, List, Optional
 
-import azure.cognitiveservices.speech as speechsdk
 from fastapi import HTTPException
-from pydub import AudioSegment
 from redis.asyncio import Redis
 
+from app.api.pronounciation_test.scorer import get_assessment_pool
 from app.models import User
 from app.models.base import UserTestRecord
-from settings import settings
-
-
-# from imageio_ffmpeg import get_ffmpeg_exe
-# AudioSegment.converter = get_ffmpeg_exe()
 
 
 def verify_audio_format(path: str) -> bool:
@@ -53,153 +47,65 @@ def verify_audio_format(path: str) -> bool:
         raise HTTPException(status_code=401, detail=f"Invalid WAV file: {e}")
     return True
 
-def assess_pronunciation(
-        audio_path: str,
+async def assess_pronunciation(
+        wav: bytes,
         reference_text: str,
         lang: Literal["fr-FR", "ja-JP"] = "fr-FR",
-        grading_system: Literal["HundredMark", "FivePoint"] = "FivePoint",
-        granularity: Literal["Phoneme", "Word", "FullText"] = "Phoneme",
-        enable_miscue: bool = True,
 ) -> Dict[str, Any]:
     """
-    使用 Azure Speech SDK 对音频文件进行发音测评。（增强错误输出版）
-    :param audio_path: 音频文件路径（必须是 PCM16/Mono/WAV）
+    发音测评：在专用线程池中调用测评后端（Azure 或本地替身），不阻塞事件循环
+    :param wav: WAV 字节（必须是 PCM16/Mono/16kHz）
     :param reference_text: 期望朗读的文本
-    :param lang: 语种代码，例如 'fr-FR'（法语）、'ja-JP'（日语）、'en-US'（英语）
-    :param grading_system: 评分体系 ('HundredMark' / 'FivePoint')
-    :param granularity: 评分粒度 ('Phoneme' / 'Word' / 'FullText')
-    :param enable_miscue: 是否检测漏读/多读（True 推荐）
+    :param lang: 语种代码，例如 'fr-FR'（法语）、'ja-JP'（日语）
     :return: 包含整体分、准确度、流畅度、完整度及识别文本的字典
     """
-    # === 1. 加载 Azure Speech 配置 ===
-    subsciption_key = settings.AZURE_SUBSCRIPTION_KEY
-    region = "eastasia"
-    print(">>> Azure Key Loaded:", settings.AZURE_SUBSCRIPTION_KEY[:8], "...")
-    print(">>> Azure Region:", "eastasia")
-
-    if not subsciption_key or not region:
-        raise RuntimeError("缺少 Azure Speech 环境变量 AZURE_SPEECH_KEY / AZURE_SPEECH_REGION")
-
-    speech_config = speechsdk.SpeechConfig(subscription=subsciption_key, region=region)
-    speech_config.speech_recognition_language = lang
-
-    # === 2. 加载音频文件 ===
-    audio_config = speechsdk.audio.AudioConfig(filename=audio_path)
-    recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
-
-    print(reference_text)
-
-    # === 3. 构建发音测评配置 ===
-    pron_assestment = speechsdk.PronunciationAssessmentConfig(
-        reference_text=reference_text,
-        grading_system=getattr(speechsdk.PronunciationAssessmentGradingSystem, grading_system),
-        granularity=getattr(speechsdk.PronunciationAssessmentGranularity, granularity),
-        enable_miscue=enable_miscue
-    )
-    pron_assestment.apply_to(recognizer)
+    return await get_assessment_pool().assess(wav, reference_text, lang)
 
-    # === 4. 执行识别与打分 ===
-    result = recognizer.recognize_once()
 
-    if result.reason != speechsdk.ResultReason.RecognizedSpeech:
-        return __parse_azure_error(result)
+# 单句测评结果，按会话隔离（旧会话没有 id，使用不带会话 id 的 key）：
+#   test_result:{user_id}:{session_id}:items  HASH  sentence_id → JSON（HSETNX，同一句重复提交只记第一次）
+#   test_result:{user_id}:{session_id}:sums   HASH  count、各项分数之和 与 n:{field}（该项有分数的句数）
+# 清除会话后新会话即使抽到同一句，也不会与上一次会话的成绩冲突
+SCORE_FIELDS = ("overall", "accuracy", "fluency", "completeness")
 
-    pa_result = result.properties.get(speechsdk.PropertyId.SpeechServiceResponse_JsonResult)
-    data = json.loads(pa_result)
-    pa_data = data["NBest"][0]["PronunciationAssessment"]
+# KEYS: items, sums
+# ARGV: sentence_id, 结果 JSON, 过期秒数, 然后每两个一组（field, 分数，无分数时为空串）
+# 返回: 新写入时为该句的序号（从 1 开始），重复提交返回 0
+SAVE_RESULT_LUA = """
+local seq = tonumber(redis.call('HGET', KEYS[2], 'count') or '0') + 1
+local entry = cjson.decode(ARGV[2])
+entry['seq'] = seq
+if redis.call('HSETNX', KEYS[1], ARGV[1], cjson.encode(entry)) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[2], 'count', seq)
+for i = 4, #ARGV, 2 do
+    if ARGV[i + 1] ~= '' then
+        redis.call('HINCRBYFLOAT', KEYS[2], ARGV[i], ARGV[i + 1])
+        redis.call('HINCRBY', KEYS[2], 'n:' .. ARGV[i], 1)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return seq
+"""
 
-    return {
-        "ok": True,
-        "recognized_text": data.get("DisplayText"),
-        "overall_score": pa_data.get("PronScore"),
-        "accuracy": pa_data.get("AccuracyScore"),
-        "fluency": pa_data.get("FluencyScore"),
-        "completeness": pa_data.get("CompletenessScore")
-    }
+_save_result_script = None
 
-def __parse_azure_error(result: Any) -> Dict[str, Any]:
-    """
-    从 Azure Speech 识别结果中提取详细错误信息。
-    用于处理 ResultReason != RecognizedSpeech 的情况。
-    :param result: SpeechRecognizer 的识别结果对象
-    :return: 包含 ok=False 与详细错误字段的 dict
-    """
-    err_data = {
-        "ok": False,
-        "error": str(result.reason),
-        "details": getattr(result, "error_details", None)
-    }
 
-    # ① 无法识别语音（NoMatch）
-    if result.reason == speechsdk.ResultReason.NoMatch:
-        err_data["no_match_details"] = str(getattr(result, "no_match_details", None))
-        print("[Azure] ⚠️ NoMatch: Speech could not be recognized.")
-        print(f"[Azure] Details: {err_data['no_match_details']}")
-
-    # ② 请求被取消（Canceled）
-    elif result.reason == speechsdk.ResultReason.Canceled:
-        cancellation_details = getattr(result, "cancellation_details", None)
-        if cancellation_details:
-            err_data["cancel_reason"] = str(getattr(cancellation_details, "reason", None))
-            err_data["cancel_error_details"] = getattr(cancellation_details, "error_details", None)
-            err_data["cancel_error_code"] = getattr(cancellation_details, "error_code", None)
-
-            print("[Azure] ❌ Canceled by Speech Service")
-            print(f"[Azure] Reason: {err_data['cancel_reason']}")
-            print(f"[Azure] Error details: {err_data['cancel_error_details']}")
-            print(f"[Azure] Error code: {err_data['cancel_error_code']}")
-        else:
-            print("[Azure] ❌ Canceled but no details provided.")
-
-    # ③ 其他未知类型
-    else:
-        print(f"[Azure] ⚠️ Unexpected recognition result: {result.reason}")
-        print(f"[Azure] Error details: {err_data['details']}")
-
-    return err_data
-
-def convert_to_pcm16_mono_wav(input_path: str, output_path: str):
-    """
-        将任意音频格式转换为 Azure Speech API 要求的标准 WAV 文件:
-        - 采样率 16 kHz
-        - 单声道
-        - 16 bit PCM
-        """
-    from pydub import AudioSegment
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _result_keys(user_id: int, session_id: Optional[str] = None) -> List[str]:
+    prefix = f"test_result:{user_id}:{session_id}" if session_id else f"test_result:{user_id}"
+    return [f"{prefix}:items", f"{prefix}:sums"]
+
+
+async def clear_test_session(redis: Redis, session_key: str, user_id: int, session_id: Optional[str] = None) -> None:
+    """删除测评会话及其成绩"""
+    await redis.delete(session_key, *_result_keys(user_id, session_id))
 
-    try:
-        audio = AudioSegment.from_file(input_path)
-        duration_ms = len(audio)
-
-        # 重新采样
-        audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-        audio.export(output_path, format="wav")
-
-        return {
-            "ok": True,
-            "path": output_path,
-            "message": f"Converted successfully ({duration_ms / 1000:.2f}s)"
-        }
-
-    except Exception as e:
-        return {
-            "ok": False,
-            "path": None,
-            "message": f"Audio conversion failed: {str(e)}"
-        }
-
-def convert_audio_to_memory(file_obj):
-    """
-    完全在内存中转化（更快）
-    :param file_obj:
-    :return: 转换后的 BinaryStream
-    """
-    audio = AudioSegment.from_file(file_obj)
-    audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-    buf = BytesIO()
-    audio.export(buf, format="wav")
-    buf.seek(0)
-    return buf
 
 async def save_pron_result(
     redis: Redis,
@@ -207,96 +113,147 @@ async def save_pron_result(
     sentence_id: int,
     text: str,
     scores: Dict[str, float],
-    expire: int = 3600
-) -> None:
+    expire: int = 3600,
+    session_id: Optional[str] = None,
+) -> bool:
     """
-    将测评结果保存到 Redis。
-    结构：test_result:{user_id} -> {"sentences": [ {...}, {...} ]}
+    将单句测评结果保存到 Redis，并在同一个脚本中累加各项分数
+    :return: 是否为新写入；同一句重复提交（如客户端重试）时返回 False，不重复计分
     """
-    key = f"test_result:{user_id}"
-    existing = await redis.get(key)
-    if existing:
-        data = json.loads(existing)
-    else:
-        data = {"sentences": []}
-
-    # 防止重复写入同一条 sentence_id
-    if not any(item["id"] == sentence_id for item in data["sentences"]):
-        entry = {
-            "id": sentence_id,
-            "text": text,
-            "overall": scores.get("overall_score"),
-            "accuracy": scores.get("accuracy"),
-            "fluency": scores.get("fluency"),
-            "completeness": scores.get("completeness")
-        }
-        data["sentences"].append(entry)
-        await redis.set(key, json.dumps(data), ex=expire)
+    global _save_result_script
+    if _save_result_script is None:
+        _save_result_script = redis.register_script(SAVE_RESULT_LUA)
+
+    entry = {
+        "id": sentence_id,
+        "text": text,
+        "overall": scores.get("overall_score"),
+        "accuracy": scores.get("accuracy"),
+        "fluency": scores.get("fluency"),
+        "completeness": scores.get("completeness")
+    }
+    args = [sentence_id, json.dumps(entry, ensure_ascii=False), expire]
+    for field in SCORE_FIELDS:
+        value = entry[field]
+        args += [field, "" if value is None else value]
+
+    seq = await _save_result_script(keys=_result_keys(user_id, session_id), args=args, client=redis)
+    return bool(seq)
+
+
+# 推进测评会话进度（比较并交换）：仅当 current_index 仍等于调用方读到的值时才推进，
+# 并跳过从该位置起连续已有成绩的句子（只看本会话的成绩）；并发或重试的请求不会把进度推进两次
+# KEYS: 会话 key, 本会话的 items key
+# ARGV: 读到的 current_index, 过期秒数, 会话 id（旧会话为空串）
+# 返回: 推进后的 current_index；会话不存在或已被新会话替换返回 -2，进度已被其他请求推进返回 -1
+ADVANCE_SESSION_LUA = """
+local data = redis.call('GET', KEYS[1])
+if not data then return -2 end
+local session = cjson.decode(data)
+local session_id = session['id']
+if type(session_id) ~= 'string' then session_id = '' end
+if session_id ~= ARGV[3] then return -2 end
+local index = tonumber(ARGV[1])
+if tonumber(session['current_index']) ~= index then return -1 end
+local ids = session['sentence_ids']
+while index < #ids and redis.call('HEXISTS', KEYS[2], tostring(ids[index + 1])) == 1 do
+    index = index + 1
+end
+session['current_index'] = index
+redis.call('SET', KEYS[1], cjson.encode(session), 'EX', ARGV[2])
+return index
+"""
+
+_advance_session_script = None
+
+
+async def advance_session(
+    redis: Redis,
+    session_key: str,
+    user_id: int,
+    expected_index: int,
+    expire: int = 3600,
+    session_id: Optional[str] = None,
+) -> int:
+    """
+    :param session_id: 调用方读到的会话 id；会话已被清除重建时不推进
+    :return: 推进后的 current_index；会话不存在或已被替换返回 -2，进度已被其他请求推进返回 -1
+    """
+    global _advance_session_script
+    if _advance_session_script is None:
+        _advance_session_script = redis.register_script(ADVANCE_SESSION_LUA)
+    items_key = _result_keys(user_id, session_id)[0]
+    return int(await _advance_session_script(
+        keys=[session_key, items_key], args=[expected_index, expire, session_id or ""], client=redis
+    ))
+
+
+# 等级映射函数
+def grade(score: float) -> str:
+    if score >= 4.5:
+        return "优秀 🏆"
+    elif score >= 3.5:
+        return "良好 👍"
+    elif score >= 2.5:
+        return "一般 🙂"
+    elif score > 0:
+        return "需改进 ⚠️"
+    return "无数据"
+
 
 async def get_pron_result(
     redis: Redis,
     user_id: int,
-    delete_after: bool = False
+    delete_after: bool = False,
+    include_sentences: bool = True,
+    session_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
-    从 Redis 获取用户的所有句子测评结果，
-    返回每句分数 + 总分 + 平均分 + 等级评定。
+    从 Redis 获取用户的测评结果：总分与平均分直接由累加值得出，不再遍历全部句子重新计算
+    :param include_sentences: 是否附带每句的分数（按提交顺序）
     """
-    key = f"test_result:{user_id}"
-    data = await redis.get(key)
-
-    if not data:
+    items_key, sums_key = _result_keys(user_id, session_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hgetall(sums_key)
+        if include_sentences:
+            pipe.hvals(items_key)
+        if delete_after:
+            pipe.delete(items_key, sums_key)
+        replies = await pipe.execute()
+
+    sums = replies[0]
+    if not sums:
         return {"ok": False, "error": "No result found"}
-
-    result_data = json.loads(data)
-    sentences: List[Dict[str, Any]] = result_data.get("sentences", [])
-
-    if not sentences:
+    count = int(sums.get("count", 0))
+    if not count:
         return {"ok": False, "error": "Empty result list"}
 
-    fields = ["overall", "accuracy", "fluency", "completeness"]
-
-    # 计算总分与平均分
-    totals = {f: 0.0 for f in fields}
-    counts = {f: 0 for f in fields}
-    for s in sentences:
-        for f in fields:
-            if s.get(f) is not None:
-                totals[f] += s[f]
-                counts[f] += 1
-
+    totals = {f: float(sums.get(f, 0)) for f in SCORE_FIELDS}
+    counts = {f: int(sums.get(f"n:{f}", 0)) for f in SCORE_FIELDS}
     averages = {
         f: round(totals[f] / counts[f], 2) if counts[f] else 0.0
-        for f in fields
+        for f in SCORE_FIELDS
     }
 
-    # 等级映射函数
-    def grade(score: float) -> str:
-        if score >= 4.5:
-            return "优秀 🏆"
-        elif score >= 3.5:
-            return "良好 👍"
-        elif score >= 2.5:
-            return "一般 🙂"
-        elif score > 0:
-            return "需改进 ⚠️"
-        return "无数据"
-
     # 各项等级 + 总体等级
-    grade_map = {f: grade(averages[f]) for f in fields}
+    grade_map = {f: grade(averages[f]) for f in SCORE_FIELDS}
     grade_map["overall_level"] = grade(averages["overall"])
 
-    if delete_after:
-        await redis.delete(key)
-
-    return {
+    result = {
         "ok": True,
-        "count": len(sentences),
-        "totals": {f: round(totals[f], 2) for f in fields},
+        "count": count,
+        "totals": {f: round(totals[f], 2) for f in SCORE_FIELDS},
         "average": averages,
         "grades": grade_map,
-        "sentences": sentences
     }
+    if include_sentences:
+        sentences = [json.loads(item) for item in replies[1]]
+        sentences.sort(key=lambda item: item.get("seq", 0))
+        for item in sentences:
+            item.pop("seq", None)
+        result["sentences"] = sentences
+    return result
+
 
 async def record_test_result(
     user: User,
@@ -0,0 +1,148 @@
+from typing import Tuple, Dict
+
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.api.translator import service
+from app.api.translator.service import baidu_translation
+from app.core.rate_limit import acquire, enforce, rate_limit
+from app.models import User
+from app.schemas.trans_schemas import TransResponse, TransRequest, TransBatchRequest, TransBatchResponse, TransBatchItem
+from app.utils.security import is_admin_user, get_current_user
+
+translator_router = APIRouter()
+
+
+@translator_router.post('/translate', response_model=TransResponse)
+async def translate(
+        request: Request,
+        response: Response,
+        translate_request: TransRequest,
+        user: Tuple[User, Dict] = Depends(get_current_user),
+):
+    """
+    依次尝试：翻译缓存（进程内 LRU → Redis）→ 词典释义 → 百度翻译
+    前两步命中时不调用百度翻译，也不占用速率限制名额
+    """
+    app_redis = request.app.state.redis
+    query = translate_request.query
+    from_lang = translate_request.from_lang
+    to_lang = translate_request.to_lang
+
+    cached, level = await service.get_cached_translation(app_redis, query, from_lang, to_lang)
+    if cached is not None:
+        await service.record_translation_source(app_redis, level)
+        return TransResponse(translated_text=cached, source="cache")
+
+    local_text = await service.resolve_locally(query=query, from_lang=from_lang, to_lang=to_lang)
+    if local_text is not None:
+        await service.record_translation_source(app_redis, "dictionary")
+        return TransResponse(translated_text=local_text, source="dictionary")
+
+    await enforce(request, response, "translate", str(user[0].id))
+    try:
+        text = await baidu_translation(query=query, from_lang=from_lang, to_lang=to_lang)
+    except HTTPException as e:
+        print(e.status_code, e.detail)
+        raise HTTPException(status_code=400, detail=e.detail)
+    await service.set_cached_translation(app_redis, query, from_lang, to_lang, text)
+    await service.record_translation_source(app_redis, "upstream")
+    return TransResponse(translated_text=text)
+
+
+@translator_router.post('/translate/batch', response_model=TransBatchResponse)
+async def translate_batch(
+        request: Request,
+        response: Response,
+        batch_request: TransBatchRequest,
+        user: Tuple[User, Dict] = Depends(get_current_user),
+):
+    """
+    批量翻译（如文章逐段翻译）：缓存命中的段落直接返回，其余段落按百度翻译的长度上限
+    用换行拼接成尽量少的请求，按 trans_result 拆回各段；结果顺序与 segments 一致
+    速率限制按实际调用百度翻译的次数计
+    """
+    app_redis = request.app.state.redis
+    from_lang = batch_request.from_lang
+    to_lang = batch_request.to_lang
+    segments = batch_request.segments
+    unique_segments = list(dict.fromkeys(segments))
+
+    cached = await service.get_cached_translations(app_redis, unique_segments, from_lang, to_lang)
+    pending = [segment for segment in unique_segments if segment not in cached]
+
+    # 每段拆成非空行，所有待翻译的行按顺序排成一个列表，记录每段对应的行区间
+    lines = []
+    spans = {}
+    for segment in pending:
+        segment_lines = service.split_segment(segment)
+        spans[segment] = (len(lines), len(lines) + len(segment_lines))
+        lines.extend(segment_lines)
+
+    translated = {}
+    batches = service.pack_lines(lines)
+    if batches:
+        translated_lines = [""] * len(lines)
+        for batch in batches:
+            # 每次调用百度翻译消耗一个额度，额度不足时按规则速率等待
+            limited = await acquire(app_redis, "translate", str(user[0].id))
+            try:
+                part = await service.baidu_translate_lines(lines, [batch], from_lang, to_lang)
+            except HTTPException as e:
+                raise HTTPException(status_code=400, detail=e.detail)
+            for i in batch:
+                translated_lines[i] = part[i]
+        response.headers.update(limited.headers())
+        translated = {
+            segment: "\n".join(translated_lines[start:end])
+            for segment, (start, end) in spans.items()
+        }
+        await service.set_cached_translations(app_redis, translated, from_lang, to_lang)
+
+    # 来源统计按去重后的段落计：重复段落只查一次缓存，也只发给上游一次
+    counts = {"l1": 0, "l2": 0, "upstream": len(translated)}
+    for _, level in cached.values():
+        counts[level] += 1
+    await service.record_translation_sources(app_redis, counts)
+
+    results = []
+    for segment in segments:
+        if segment in cached:
+            results.append(TransBatchItem(translated_text=cached[segment][0], source="cache"))
+        else:
+            results.append(TransBatchItem(translated_text=translated[segment], source="baidu"))
+
+    return TransBatchResponse(results=results, upstream_calls=len(batches))
+
+
+@translator_router.get('/translate/stats')
+async def translate_stats(
+        request: Request,
+        admin_user: Tuple[User, dict] = Depends(is_admin_user)
+):
+    """
+    翻译请求来源统计：缓存命中率、词典本地作答次数、百度翻译调用次数与节省的调用次数
+    """
+    return await service.get_translation_stats(request.app.state.redis)
+
+
+@translator_router.post('/translate/debug', dependencies=[Depends(rate_limit("translate"))])
+async def test_translate(
+        query: str,
+        from_lang: str = "auto",
+        to_lang: str = 'zh',
+        admin_user: Tuple[User, dict] = Depends(is_admin_user)
+):
+    """
+    尝试使用多次翻译请求接口，要求在前端监听输入在约300ms左右内保持不输入再传入，
+    同时后端检查避免多次恶意访问
+    :param query: 待翻译文本
+    :param from_lang: 源语言，默认auto，百度API自动检测
+    :param to_lang: 目标语言，不允许auto
+    :param admin_user: 测试接口，仅管理员权限可用
+    :return:
+    """
+    raw = await baidu_translation(query, from_lang, to_lang)
+    print(raw)
+    return TransResponse(translated_text=raw)
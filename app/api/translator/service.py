@@ -0,0 +1,297 @@
+import random
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from redis.asyncio import Redis
+
+from app.core.cache import TwoLevelCache, hash_key
+from app.core.http_clients import get_http_client
+from app.models.fr import DefinitionFr, ProverbFr
+from app.models.jp import DefinitionJp, IdiomJp
+from app.utils.md5 import make_md5
+from app.utils.textnorm import normalize_text
+from settings import settings
+
+# For list of language codes, please refer to `https://api.fanyi.baidu.com/doc/21`
+BAIDU_TRANSLATE_URL = "http://api.fanyi.baidu.com/api/trans/vip/translate"
+# 单次请求 q 的长度上限（UTF-8 字节）；多行文本用换行分隔，trans_result 按行返回
+BAIDU_MAX_QUERY_BYTES = 6000
+
+# 请求来源计数（Redis hash），字段：dictionary / l1 / l2 / upstream
+TRANSLATE_STATS_KEY = "translate:stats"
+TRANSLATE_SOURCES = ("dictionary", "l1", "l2", "upstream")
+
+# 只有短文本才尝试查词典：词条 text 最长 40，谚语/惯用语一般不超过一句话
+LOCAL_MAX_WORD_LEN = 40
+LOCAL_MAX_PHRASE_LEN = 120
+
+# 翻译缓存：按语言对设置 TTL；auto 检测结果可能随上下文变化，缓存时间较短
+TRANSLATION_TTL_DEFAULT = 3 * 86400
+TRANSLATION_TTL: Dict[Tuple[str, str], int] = {
+    ("fra", "zh"): 7 * 86400,
+    ("jp", "zh"): 7 * 86400,
+    ("zh", "fra"): 7 * 86400,
+    ("zh", "jp"): 7 * 86400,
+    ("en", "zh"): 7 * 86400,
+    ("auto", "zh"): 86400,
+    ("auto", "en"): 86400,
+}
+translation_cache = TwoLevelCache(
+    namespace="translate:cache",
+    local_maxsize=4096,
+    local_ttl=600,
+    redis_max_entries=200_000,
+)
+
+
+async def _baidu_request(query: str, from_lang: str, to_lang: str) -> List[Dict[str, str]]:
+    """
+    :return: trans_result，每个非空行一项 {"src": ..., "dst": ...}
+    """
+    appid = settings.BAIDU_APPID
+    appkey = settings.BAIDU_APPKEY
+
+    salt = str(random.randint(32768, 65536))
+    sign = make_md5(appid + query + salt + appkey)
+
+    payload = {
+        "q": query,
+        "from": from_lang,
+        "to": to_lang,
+        "appid": appid,
+        "salt": salt,
+        "sign": sign,
+    }
+
+    client = get_http_client("baidu")
+    response = await client.post(
+        BAIDU_TRANSLATE_URL,
+        data=payload,
+        headers={'Content-Type': 'application/x-www-form-urlencoded'}
+    )
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail=response.json())
+
+    data = response.json()
+
+    if "trans_result" not in data:
+        raise HTTPException(status_code=500, detail={"error_code": data.get("error_code"), "error_msg": data.get("error_msg")})
+
+    return data["trans_result"]
+
+
+async def baidu_translation(query: str, from_lang: str, to_lang: str):
+    trans_result = await _baidu_request(query, from_lang, to_lang)
+    return "\n".join([item["dst"] for item in trans_result])
+
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def pack_lines(lines: List[str], max_bytes: int = BAIDU_MAX_QUERY_BYTES) -> List[List[int]]:
+    """
+    按顺序把行装入尽量少的请求，每个请求的 "\n".join 不超过 max_bytes
+    单行超过上限时单独成一个请求
+    :return: 每个请求包含的行下标
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+    for i, line in enumerate(lines):
+        line_size = _utf8_len(line)
+        # 加上分隔用的换行符
+        extra = line_size + (1 if current else 0)
+        if current and size + extra > max_bytes:
+            batches.append(current)
+            current, size = [], 0
+            extra = line_size
+        current.append(i)
+        size += extra
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def baidu_translate_lines(lines: List[str], batches: List[List[int]], from_lang: str, to_lang: str) -> List[str]:
+    """
+    批量翻译若干非空单行文本，每个 batch 合并为一次百度翻译请求
+    :param batches: pack_lines 的结果
+    :return: 与 lines 一一对应的译文
+    """
+    translated: List[str] = [""] * len(lines)
+    # 顺序调用：百度翻译按账号限制 QPS，并发打包请求容易触发 54003
+    for batch in batches:
+        trans_result = await _baidu_request("\n".join(lines[i] for i in batch), from_lang, to_lang)
+        if len(trans_result) != len(batch):
+            raise HTTPException(
+                status_code=500,
+                detail=f"百度翻译返回 {len(trans_result)} 行，期望 {len(batch)} 行",
+            )
+        for i, item in zip(batch, trans_result):
+            translated[i] = item["dst"]
+    return translated
+
+
+def split_segment(segment: str) -> List[str]:
+    # 百度翻译会丢弃空行，这里只保留非空行，翻译后用换行重新拼接
+    return [line.strip() for line in segment.splitlines() if line.strip()]
+
+
+def _join_unique(items: List[Optional[str]]) -> Optional[str]:
+    # 多个释义去重后用中文分号连接，保留数据库中的顺序
+    seen = []
+    for item in items:
+        item = (item or "").strip()
+        if item and item not in seen:
+            seen.append(item)
+    return "；".join(seen) if seen else None
+
+
+# 法语词典各目标语言对应的释义列
+FR_DEFINITION_COLUMNS = {"zh": "meaning", "en": "eng_explanation"}
+
+
+def _has_kana(text: str) -> bool:
+    return any("\u3040" <= ch <= "\u30ff" or "\u31f0" <= ch <= "\u31ff" for ch in text)
+
+
+def _guess_dict_lang(text: str, from_lang: str) -> Optional[str]:
+    if from_lang == "fra":
+        return "fr"
+    if from_lang == "jp":
+        return "jp"
+    if from_lang != "auto":
+        return None
+    # auto：只有含假名时才能确定是日语；拉丁字母可能是英语等其他语言（chat、pain），交给百度翻译识别
+    return "jp" if _has_kana(text) else None
+
+
+async def _lookup_fr(text: str, to_lang: str) -> Optional[str]:
+    column = FR_DEFINITION_COLUMNS.get(to_lang)
+    if column is None:
+        return None
+    search_text = normalize_text(text)
+    if len(text) <= LOCAL_MAX_WORD_LEN:
+        rows = await DefinitionFr.filter(word__search_text=search_text).order_by("id").values_list(column, flat=True)
+        answer = _join_unique(rows)
+        if answer:
+            return answer
+
+    if to_lang == "zh":
+        proverb = await ProverbFr.filter(search_text=search_text).order_by("id").first().values("chi_exp")
+        if proverb:
+            return _join_unique([proverb["chi_exp"]])
+    return None
+
+
+async def _lookup_jp(text: str, to_lang: str) -> Optional[str]:
+    # 日语词典只有中文释义
+    if to_lang != "zh":
+        return None
+    if len(text) <= LOCAL_MAX_WORD_LEN:
+        rows = await DefinitionJp.filter(word__text=text).order_by("id").values_list("meaning", flat=True)
+        answer = _join_unique(rows)
+        if answer:
+            return answer
+
+    idiom = await IdiomJp.filter(text=text).order_by("id").first().values("chi_exp")
+    if idiom:
+        return _join_unique([idiom["chi_exp"]])
+    return None
+
+
+async def resolve_locally(query: str, from_lang: str, to_lang: str) -> Optional[str]:
+    """
+    输入恰好是词典中的词条或谚语/惯用语时，直接用词典释义作答，不调用百度翻译
+    :return: 词典释义；无法本地作答时返回 None
+    """
+    text = query.strip()
+    if not text or len(text) > LOCAL_MAX_PHRASE_LEN or "\n" in text:
+        return None
+
+    dict_lang = _guess_dict_lang(text, from_lang)
+    if dict_lang == "fr":
+        return await _lookup_fr(text, to_lang)
+    if dict_lang == "jp":
+        return await _lookup_jp(text, to_lang)
+    return None
+
+
+def translation_cache_key(query: str, from_lang: str, to_lang: str) -> str:
+    # 规范化：NFC + 首尾空白去除 + 连续空白合并；保留大小写与标点，它们会影响译文
+    text = " ".join(unicodedata.normalize("NFC", query).split())
+    return hash_key(from_lang, to_lang, text)
+
+
+def translation_ttl(from_lang: str, to_lang: str) -> int:
+    return TRANSLATION_TTL.get((from_lang, to_lang), TRANSLATION_TTL_DEFAULT)
+
+
+async def get_cached_translation(redis: Redis, query: str, from_lang: str, to_lang: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    :return: (译文, 命中层级 "l1" / "l2" / None)
+    """
+    return await translation_cache.get(redis, translation_cache_key(query, from_lang, to_lang))
+
+
+async def set_cached_translation(redis: Redis, query: str, from_lang: str, to_lang: str, text: str) -> None:
+    await translation_cache.set(
+        redis,
+        translation_cache_key(query, from_lang, to_lang),
+        text,
+        ttl=translation_ttl(from_lang, to_lang),
+    )
+
+
+async def get_cached_translations(redis: Redis, queries: List[str], from_lang: str, to_lang: str) -> Dict[str, Tuple[str, str]]:
+    """
+    :return: {query: (译文, 命中层级)}，未命中的 query 不出现在结果中
+    """
+    keys = {query: translation_cache_key(query, from_lang, to_lang) for query in queries}
+    found = await translation_cache.get_many(redis, list(keys.values()))
+    return {query: found[key] for query, key in keys.items() if key in found}
+
+
+async def set_cached_translations(redis: Redis, translations: Dict[str, str], from_lang: str, to_lang: str) -> None:
+    await translation_cache.set_many(
+        redis,
+        {translation_cache_key(query, from_lang, to_lang): text for query, text in translations.items()},
+        ttl=translation_ttl(from_lang, to_lang),
+    )
+
+
+async def record_translation_source(redis: Redis, source: str) -> None:
+    await redis.hincrby(TRANSLATE_STATS_KEY, source, 1)
+
+
+async def record_translation_sources(redis: Redis, counts: Dict[str, int]) -> None:
+    async with redis.pipeline(transaction=False) as pipe:
+        for source, count in counts.items():
+            if count:
+                pipe.hincrby(TRANSLATE_STATS_KEY, source, count)
+        await pipe.execute()
+
+
+async def get_translation_stats(redis: Redis) -> dict:
+    raw = await redis.hgetall(TRANSLATE_STATS_KEY)
+    counts = {src: int(raw.get(src, 0)) for src in TRANSLATE_SOURCES}
+    # 路由中先查缓存，未命中再查词典、最后调用百度，所以每个请求都经过一次缓存查询
+    total = sum(counts.values())
+    cache_hits = counts["l1"] + counts["l2"]
+
+    def ratio(n: int, d: int) -> float:
+        return round(n / d, 4) if d else 0.0
+
+    return {
+        "total": total,
+        **counts,
+        # 词典作答和缓存命中都不调用百度翻译
+        "saved_upstream_calls": counts["dictionary"] + cache_hits,
+        "local_ratio": ratio(counts["dictionary"], total),
+        "cache_hit_ratio": ratio(cache_hits, total),
+        "l1_hit_ratio": ratio(counts["l1"], total),
+        "cache_size": await translation_cache.size(redis),
+    }
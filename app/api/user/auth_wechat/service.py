@@ -2,11 +2,11 @@ import secrets
 from typing import Any, Dict, Optional
 from urllib.parse import urlencode
 
-import httpx
 from fastapi import HTTPException
 from redis.asyncio import Redis
 
 from app.api.user.service import hash_password, build_login_response
+from app.core.http_clients import get_http_client
 from app.models.base import Language, OAuthIdentity, User
 from settings import settings
 
@@ -64,9 +64,8 @@ async def wechat_exchange_code_for_token(code: str) -> Dict[str, Any]:
         "code": code,
         "grant_type": "authorization_code",
     }
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.get(url, params=params)
-        data = response.json()
+    response = await get_http_client("wechat").get(url, params=params)
+    data = response.json()
 
     if "errcode" in data and data["errcode"] != 0:
         raise HTTPException(status_code=400, detail=f"WeChat token error: {data}")
@@ -78,9 +77,8 @@ async def wechat_exchange_code_for_token(code: str) -> Dict[str, Any]:
 async def wechat_get_userinfo(access_token: str, openid: str) -> Dict[str, Any]:
     url = "https://api.weixin.qq.com/sns/userinfo"
     params = {"access_token": access_token, "openid": openid, "lang": "zh_CN"}
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.get(url, params=params)
-        data = response.json()
+    response = await get_http_client("wechat").get(url, params=params)
+    data = response.json()
 
     if "errcode" in data and data["errcode"] != 0:
         raise HTTPException(status_code=400, detail=f"WeChat userinfo error: {data}")
@@ -95,9 +93,8 @@ async def wechat_mini_exchange_code_for_session(code: str) -> Dict[str, Any]:
         "js_code": code,
         "grant_type": "authorization_code",
     }
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.get(url, params=params)
-        data = response.json()
+    response = await get_http_client("wechat").get(url, params=params)
+    data = response.json()
 
     if "errcode" in data and data["errcode"] != 0:
         raise HTTPException(status_code=400, detail=f"WeChat mini session error: {data}")
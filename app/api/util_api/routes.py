@@ -1,7 +1,14 @@
 #TODO 更新接口文档
-from fastapi import APIRouter
+from typing import Tuple
+
+from fastapi import APIRouter, Depends
 from starlette.requests import Request
 
+from app.core.ai_scheduler import ai_bulkhead
+from app.core.http_clients import pool_stats
+from app.models import User
+from app.utils.security import is_admin_user
+
 ulit_router = APIRouter()
 
 @ulit_router.get("/search_time", tags=["search times"])
@@ -27,3 +34,19 @@ async def reset_search_time(request: Request):
     return {
         "message": "search times reset successfully",
     }
+
+
+@ulit_router.get("/http/pool", tags=["http pool stats"])
+async def get_http_pool_stats(admin_user: Tuple[User, dict] = Depends(is_admin_user)):
+    """
+    各上游服务（百度翻译、AI 助手、微信、ECNU）共享连接池的使用情况，仅管理员可用
+    """
+    return pool_stats()
+
+
+@ulit_router.get("/ai/scheduler", tags=["ai scheduler stats"])
+async def get_ai_scheduler_stats(admin_user: Tuple[User, dict] = Depends(is_admin_user)):
+    """
+    上游 AI 调用舱壁的状态：并发数、排队数、削峰次数与排队等待时间分位数（当前 worker），仅管理员可用
+    """
+    return ai_bulkhead.stats()
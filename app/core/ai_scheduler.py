@@ -0,0 +1,150 @@
+"""
+上游 AI 调用的舱壁（bulkhead）调度
+
+- 全局并发上限：同一 worker 同时进行的大模型调用不超过 max_concurrency，
+  慢接口不会占满 worker，查词等快接口不受影响
+- 按用户公平排队：名额释放时在排队的用户之间轮转分配，单个用户的连发请求不会挤占其他用户
+- 按队列深度削峰：排队数达到 max_queue 或等待超时返回 503，并带 Retry-After
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+# 最近若干次的排队等待时间，用于统计分位数
+WAIT_SAMPLES = 1000
+
+
+class AIBulkhead:
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 64, queue_timeout: float = 30):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        # 用户 → 该用户排队中的 future；OrderedDict 的顺序即轮转顺序
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._durations: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._counters = {"admitted": 0, "waited": 0, "shed": 0, "timeout": 0}
+
+    def _retry_after(self) -> int:
+        # 按平均调用时长估算排队中的请求全部完成所需的时间
+        avg = sum(self._durations) / len(self._durations) if self._durations else 10
+        return max(math.ceil(avg * (self._queued + 1) / self.max_concurrency), 1)
+
+    def _reject(self, reason: str) -> HTTPException:
+        self._counters[reason] += 1
+        return HTTPException(
+            status_code=503,
+            detail="AI 服务繁忙，请稍后再试",
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    def check_admission(self) -> None:
+        """
+        排队已满时直接拒绝；用于流式接口在返回响应头之前提前削峰
+        """
+        if self.active >= self.max_concurrency and self._queued >= self.max_queue:
+            raise self._reject("shed")
+
+    async def acquire(self, user_id: str) -> None:
+        start = time.monotonic()
+        if self.active < self.max_concurrency and self._queued == 0:
+            self.active += 1
+            self._record_admit(start)
+            return
+
+        if self._queued >= self.max_queue:
+            raise self._reject("shed")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_id, deque()).append(future)
+        self._queued += 1
+        self._counters["waited"] += 1
+        try:
+            # 名额由 release 直接转交给 future，active 计数不变
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # 名额已经转交过来但调用方放弃了，归还名额
+                self.release()
+            else:
+                future.cancel()
+                self._remove_waiter(user_id, future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("timeout")
+            raise
+        self._record_admit(start)
+
+    def release(self) -> None:
+        # 轮转：取队首用户的第一个请求，然后把该用户移到队尾
+        while self._waiters:
+            user_id, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._waiters.move_to_end(user_id)
+            else:
+                del self._waiters[user_id]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove_waiter(self, user_id: str, future: asyncio.Future) -> None:
+        queue = self._waiters.get(user_id)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        self._queued -= 1
+        if not queue:
+            del self._waiters[user_id]
+
+    def _record_admit(self, start: float) -> None:
+        self._counters["admitted"] += 1
+        self._waits.append(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str]):
+        await self.acquire(user_id or "system")
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._durations.append(time.monotonic() - start)
+            self.release()
+
+    def stats(self) -> Dict:
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(int(len(waits) * p), len(waits) - 1)], 3)
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self._queued,
+            "queued_users": len(self._waiters),
+            **self._counters,
+            "wait_seconds": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(waits[-1], 3) if waits else 0.0,
+            },
+            "avg_call_seconds": round(sum(self._durations) / len(self._durations), 3) if self._durations else 0.0,
+        }
+
+
+# 同一 worker 内所有上游 AI 调用（AI 助手、作文指导）共用一个舱壁
+ai_bulkhead = AIBulkhead(max_concurrency=16, max_queue=64, queue_timeout=30)
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+
+def hash_key(*parts: str) -> str:
+    """把若干字段拼接后取 sha1，作为定长缓存键"""
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class LRUTTLCache:
+    """
+    进程内 LRU 缓存，条目带过期时间；超过 maxsize 时淘汰最久未使用的条目
+    只在事件循环线程内使用，不加锁
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TwoLevelCache:
+    """
+    两级缓存：进程内 LRU（L1）在前，Redis（L2）在后
+    - L2 每个条目一个 key 并带 TTL，同时在 {namespace}:index（ZSET，按写入时间）中登记，
+      条目数超过 redis_max_entries 时淘汰最早写入的条目
+    - L2 命中会回填 L1；L1 的 TTL 不超过 local_ttl，避免各 worker 长时间持有过期数据
+    """
+
+    def __init__(
+            self,
+            namespace: str,
+            local_maxsize: int = 2048,
+            local_ttl: int = 300,
+            redis_max_entries: int = 100_000,
+    ):
+        self.namespace = namespace
+        self.local = LRUTTLCache(maxsize=local_maxsize)
+        self.local_ttl = local_ttl
+        self.redis_max_entries = redis_max_entries
+
+    @property
+    def index_key(self) -> str:
+        return f"{self.namespace}:index"
+
+    def redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, redis: Redis, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        :return: (缓存值, 命中层级 "l1" / "l2" / None)
+        """
+        value = self.local.get(key)
+        if value is not None:
+            return value, "l1"
+
+        raw = await redis.get(self.redis_key(key))
+        if raw is None:
+            return None, None
+        value = json.loads(raw)
+        self.local.set(key, value, ttl=self.local_ttl)
+        return value, "l2"
+
+    async def set(self, redis: Redis, key: str, value: Any, ttl: int) -> None:
+        self.local.set(key, value, ttl=min(ttl, self.local_ttl))
+
+        now = time.time()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.redis_key(key), json.dumps(value, ensure_ascii=False), ex=ttl)
+            pipe.zadd(self.index_key, {key: now})
+            pipe.zcard(self.index_key)
+            results = await pipe.execute()
+        await self._evict_overflow(redis, results[-1])
+
+    async def get_many(self, redis: Redis, keys: List[str]) -> Dict[str, Tuple[Any, str]]:
+        """
+        批量读取：L1 未命中的键用一次 MGET 从 L2 读取
+        :return: {key: (缓存值, 命中层级)}，未命中的键不出现在结果中
+        """
+        found: Dict[str, Tuple[Any, str]] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.local.get(key)
+            if value is not None:
+                found[key] = (value, "l1")
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+
+        for key, raw in zip(missing, await redis.mget([self.redis_key(k) for k in missing])):
+            if raw is None:
+                continue
+            value = json.loads(raw)
+            self.local.set(key, value, ttl=self.local_ttl)
+            found[key] = (value, "l2")
+        return found
+
+    async def set_many(self, redis: Redis, items: Dict[str, Any], ttl: int) -> None:
+        if not items:
+            return
+        now = time.time()
+        async with redis.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                self.local.set(key, value, ttl=min(ttl, self.local_ttl))
+                pipe.set(self.redis_key(key), json.dumps(value, ensure_ascii=False), ex=ttl)
+            pipe.zadd(self.index_key, {key: now for key in items})
+            pipe.zcard(self.index_key)
+            results = await pipe.execute()
+        await self._evict_overflow(redis, results[-1])
+
+    async def _evict_overflow(self, redis: Redis, size: int) -> None:
+        overflow = size - self.redis_max_entries
+        if overflow > 0:
+            evicted = await redis.zpopmin(self.index_key, overflow)
+            if evicted:
+                await redis.delete(*(self.redis_key(k) for k, _ in evicted))
+
+    async def delete(self, redis: Redis, key: str) -> None:
+        self.local.delete(key)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.delete(self.redis_key(key))
+            pipe.zrem(self.index_key, key)
+            await pipe.execute()
+
+    async def delete_many(self, redis: Redis, keys: List[str]) -> int:
+        if not keys:
+            return 0
+        for key in keys:
+            self.local.delete(key)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.delete(*(self.redis_key(k) for k in keys))
+            pipe.zrem(self.index_key, *keys)
+            results = await pipe.execute()
+        return results[-1]
+
+    async def entries(self, redis: Redis, offset: int = 0, limit: int = 50) -> List[Tuple[str, Any, float]]:
+        """
+        按写入时间倒序列出 L2 中的条目，顺带清理索引中已过期的键
+        :return: [(key, 缓存值, 写入时间戳)]
+        """
+        items = await redis.zrevrange(self.index_key, offset, offset + limit - 1, withscores=True)
+        if not items:
+            return []
+        raws = await redis.mget([self.redis_key(k) for k, _ in items])
+        expired = [k for (k, _), raw in zip(items, raws) if raw is None]
+        if expired:
+            await redis.zrem(self.index_key, *expired)
+        return [(k, json.loads(raw), score) for (k, score), raw in zip(items, raws) if raw is not None]
+
+    async def scan(self, redis: Redis, batch_size: int = 500):
+        """
+        遍历 L2 中的全部条目（ZSCAN + MGET），每批产出 [(key, 缓存值)]
+        """
+        batch = []
+        async for key, _ in redis.zscan_iter(self.index_key, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield await self._load(redis, batch)
+                batch = []
+        if batch:
+            yield await self._load(redis, batch)
+
+    async def _load(self, redis: Redis, keys: List[str]) -> List[Tuple[str, Any]]:
+        raws = await redis.mget([self.redis_key(k) for k in keys])
+        return [(k, json.loads(raw)) for k, raw in zip(keys, raws) if raw is not None]
+
+    async def clear(self, redis: Redis) -> int:
+        """
+        清空本进程 L1 与全部 L2 条目；其他 worker 的 L1 最多再保留 local_ttl 秒
+        """
+        self.local.clear()
+        removed = 0
+        while True:
+            keys = await redis.zrange(self.index_key, 0, 499)
+            if not keys:
+                return removed
+            removed += await self.delete_many(redis, keys)
+
+    async def size(self, redis: Redis) -> Dict[str, int]:
+        return {"l1": len(self.local), "l2": await redis.zcard(self.index_key)}
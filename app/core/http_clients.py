@@ -0,0 +1,112 @@
+"""
+应用级共享 HTTP 客户端
+
+每个上游服务一个长连接池（keep-alive），在 FastAPI lifespan 中创建与关闭，
+避免每次调用都重新做 TCP + TLS 握手。
+"""
+from typing import Any, Dict, Optional
+
+import httpx
+
+try:  # HTTP/2 依赖 h2 包（已在 requirements.txt 中），缺失时自动退回 HTTP/1.1
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 各上游的连接数上限与超时（秒）
+# - baidu：HTTP 明文接口，不支持 HTTP/2
+# - ai_assist：LLM 推理接口，读超时较长
+# - ecnu：作文指导，交给 AsyncOpenAI 作为底层客户端
+UPSTREAMS: Dict[str, Dict[str, Any]] = {
+    "baidu": {
+        "timeout": httpx.Timeout(10, connect=3),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30),
+        "http2": False,
+    },
+    "ai_assist": {
+        "timeout": httpx.Timeout(60, connect=5),
+        "limits": httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+        "http2": True,
+    },
+    "wechat": {
+        "timeout": httpx.Timeout(10, connect=3),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=5, keepalive_expiry=30),
+        "http2": True,
+    },
+    "ecnu": {
+        "timeout": httpx.Timeout(120, connect=5),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+        "http2": True,
+    },
+}
+
+# 全局客户端
+http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    conf = UPSTREAMS[name]
+    return httpx.AsyncClient(
+        timeout=conf["timeout"],
+        limits=conf["limits"],
+        http2=conf["http2"] and HTTP2_AVAILABLE,
+    )
+
+
+# 初始化（应用启动时调用）
+async def init_http_clients() -> Dict[str, httpx.AsyncClient]:
+    for name in UPSTREAMS:
+        if name not in http_clients:
+            http_clients[name] = _build_client(name)
+    return http_clients
+
+
+async def close_http_clients() -> None:
+    for name in list(http_clients):
+        client = http_clients.pop(name)
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """获取指定上游的共享客户端；未经过 lifespan 初始化时（脚本、测试）懒加载"""
+    client = http_clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        http_clients[name] = client
+    return client
+
+
+def _pool_of(client: httpx.AsyncClient) -> Optional[Any]:
+    # httpx 未公开连接池统计，这里读取 httpcore 连接池的状态，仅用于观测
+    transport = getattr(client, "_transport", None)
+    return getattr(transport, "_pool", None)
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    各上游连接池的使用情况：
+    - connections：当前连接数；active：正在处理请求；idle：空闲可复用
+    - queued：等待空闲连接的请求数（持续大于 0 说明 max_connections 偏小）
+    """
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name, client in http_clients.items():
+        conf = UPSTREAMS[name]
+        pool = _pool_of(client)
+        connections = list(getattr(pool, "connections", []) or [])
+        requests = list(getattr(pool, "_requests", []) or [])
+        idle = sum(1 for c in connections if c.is_idle())
+        stats[name] = {
+            "max_connections": conf["limits"].max_connections,
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "queued": sum(1 for r in requests if r.is_queued()),
+            "http2": conf["http2"] and HTTP2_AVAILABLE,
+            "closed": client.is_closed,
+        }
+    return stats
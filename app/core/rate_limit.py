@@ -0,0 +1,255 @@
+"""
+基于 Redis Lua 脚本的速率限制
+
+判定与计数在同一个脚本中完成：原子执行、只需一次往返，并发请求不会超出限额。
+- token_bucket：令牌桶，容量 limit，每 window 秒补满，允许短时突发
+- sliding_window：滑动窗口日志（ZSET），任意 window 秒内最多 limit 次
+单个用户的限额可以在 ratelimit:override:{rule} 中覆盖（hash，field 为用户 ID），由脚本读取。
+"""
+import asyncio
+import math
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Literal, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, Response
+from redis.asyncio import Redis
+
+from app.models import User
+from app.utils.security import get_current_user
+
+RateLimitAlgorithm = Literal["token_bucket", "sliding_window"]
+
+# 服务端时间：多 worker 之间不依赖各自的本地时钟
+_LUA_NOW = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local override = redis.call('HGET', KEYS[2], ARGV[4])
+if override then limit = tonumber(override) end
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+-- 单次消耗超过限额的请求永远无法通过：不计数，retry_after 返回 -1
+if cost > limit then return {0, limit, 0, -1, 0} end
+"""
+
+# KEYS: 计数 key, 覆盖配置 hash
+# ARGV: limit, window(ms), cost, 用户 ID
+# 返回: {allowed, limit, remaining, retry_after(ms，cost 超过限额时为 -1), reset(ms)}
+TOKEN_BUCKET_LUA = _LUA_NOW + """
+local rate = limit / window
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or limit
+local ts = tonumber(state[2]) or now
+tokens = math.min(limit, tokens + math.max(now - ts, 0) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = math.ceil((cost - tokens) / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+return {allowed, limit, math.floor(tokens), retry_after, math.ceil((limit - tokens) / rate)}
+"""
+
+# ARGV[5]: 本次请求的唯一标识，作为 ZSET 成员
+SLIDING_WINDOW_LUA = _LUA_NOW + """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+
+local allowed = 0
+local retry_after = 0
+if count + cost <= limit then
+    for i = 1, cost do
+        redis.call('ZADD', KEYS[1], now, ARGV[5] .. ':' .. i)
+    end
+    count = count + cost
+    allowed = 1
+else
+    -- 需要再有 count + cost - limit 条记录滑出窗口
+    local entry = redis.call('ZRANGE', KEYS[1], count + cost - limit - 1, count + cost - limit - 1, 'WITHSCORES')
+    retry_after = math.max(tonumber(entry[2]) + window - now, 1)
+end
+
+local reset = 0
+local newest = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+if newest[2] then reset = tonumber(newest[2]) + window - now end
+redis.call('PEXPIRE', KEYS[1], window)
+return {allowed, limit, limit - count, retry_after, reset}
+"""
+
+_SCRIPTS: Dict[RateLimitAlgorithm, str] = {
+    "token_bucket": TOKEN_BUCKET_LUA,
+    "sliding_window": SLIDING_WINDOW_LUA,
+}
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    limit: int
+    window: float  # 秒
+    algorithm: RateLimitAlgorithm = "token_bucket"
+
+
+# 各接口的默认限额
+RATE_LIMIT_RULES: Dict[str, RateLimitRule] = {
+    # 百度翻译标准版 QPS 有限，每个用户每秒 2 次
+    "translate": RateLimitRule(limit=2, window=1, algorithm="token_bucket"),
+    # 大模型调用成本高，按分钟严格计数
+    "ai_assist": RateLimitRule(limit=10, window=60, algorithm="sliding_window"),
+    # Azure 发音测评按次计费
+    "pron_test": RateLimitRule(limit=30, window=60, algorithm="sliding_window"),
+}
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # 秒，仅被拒绝时有意义
+    reset: float  # 秒，额度完全恢复所需时间
+    oversized: bool = False  # 单次消耗超过限额，等待也无法通过
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(self.remaining, 0)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil(self.retry_after), 1))
+        return headers
+
+
+# 已注册的脚本对象（内部使用 EVALSHA，脚本缓存丢失时自动回退 EVAL）
+_registered = {}
+
+
+def _script(redis: Redis, algorithm: RateLimitAlgorithm):
+    script = _registered.get(algorithm)
+    if script is None:
+        script = redis.register_script(_SCRIPTS[algorithm])
+        _registered[algorithm] = script
+    return script
+
+
+def limit_key(rule_name: str, identity: str) -> str:
+    return f"ratelimit:{rule_name}:{identity}"
+
+
+def override_key(rule_name: str) -> str:
+    return f"ratelimit:override:{rule_name}"
+
+
+def get_rule(rule_name: str) -> RateLimitRule:
+    rule = RATE_LIMIT_RULES.get(rule_name)
+    if rule is None:
+        raise HTTPException(status_code=404, detail=f"Unknown rate limit rule: {rule_name}")
+    return rule
+
+
+async def hit(redis: Redis, rule_name: str, identity: str, cost: int = 1) -> RateLimitResult:
+    """
+    消耗 cost 个额度
+    :param rule_name: RATE_LIMIT_RULES 中的规则名
+    :param identity: 限流主体，一般为用户 ID
+    :param cost: 本次请求消耗的额度，如批量接口按上游调用次数计
+    """
+    rule = get_rule(rule_name)
+    args = [rule.limit, int(rule.window * 1000), max(int(cost), 1), identity]
+    if rule.algorithm == "sliding_window":
+        args.append(uuid.uuid4().hex)
+
+    allowed, limit, remaining, retry_after, reset = await _script(redis, rule.algorithm)(
+        keys=[limit_key(rule_name, identity), override_key(rule_name)],
+        args=args,
+        client=redis,
+    )
+    return RateLimitResult(
+        allowed=bool(allowed),
+        limit=int(limit),
+        remaining=int(remaining),
+        retry_after=max(int(retry_after), 0) / 1000,
+        reset=int(reset) / 1000,
+        oversized=int(retry_after) < 0,
+    )
+
+
+async def enforce(
+        request: Request,
+        response: Optional[Response],
+        rule_name: str,
+        identity: str,
+        cost: int = 1,
+) -> RateLimitResult:
+    """
+    超出限额时抛出 429（带 Retry-After），单次消耗超过限额时抛出 413，否则把 X-RateLimit-* 写入响应头
+    """
+    result = await hit(request.app.state.redis, rule_name, identity, cost)
+    if result.oversized:
+        raise HTTPException(status_code=413, detail=f"Request cost {cost} exceeds rate limit {result.limit}")
+    headers = result.headers()
+    if not result.allowed:
+        raise HTTPException(status_code=429, detail="Too many requests", headers=headers)
+    if response is not None:
+        response.headers.update(headers)
+    return result
+
+
+async def acquire(redis: Redis, rule_name: str, identity: str, cost: int = 1, max_wait: float = 5) -> RateLimitResult:
+    """
+    消耗 cost 个额度，额度不足时等待 retry_after 后重试；
+    需要等待超过 max_wait 秒时抛出 429，单次消耗超过限额时抛出 413。
+    用于批量接口按上游调用逐次计数：调用自然按规则的速率进行
+    """
+    while True:
+        result = await hit(redis, rule_name, identity, cost)
+        if result.oversized:
+            raise HTTPException(status_code=413, detail=f"Request cost {cost} exceeds rate limit {result.limit}")
+        if result.allowed:
+            return result
+        if result.retry_after > max_wait:
+            raise HTTPException(status_code=429, detail="Too many requests", headers=result.headers())
+        await asyncio.sleep(result.retry_after)
+
+
+def rate_limit(rule_name: str, cost: int = 1):
+    """
+    路由依赖：按当前用户限流
+    用法：@router.post(..., dependencies=[Depends(rate_limit("translate"))])
+    """
+    get_rule(rule_name)
+
+    async def dependency(
+            request: Request,
+            response: Response,
+            user: Tuple[User, Dict] = Depends(get_current_user),
+    ) -> RateLimitResult:
+        return await enforce(request, response, rule_name, str(user[0].id), cost)
+
+    return dependency
+
+
+async def get_user_limits(redis: Redis, rule_name: str) -> Dict[str, int]:
+    get_rule(rule_name)
+    raw = await redis.hgetall(override_key(rule_name))
+    return {user_id: int(limit) for user_id, limit in raw.items()}
+
+
+async def set_user_limit(redis: Redis, rule_name: str, user_id: str, limit: int) -> None:
+    get_rule(rule_name)
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit 必须大于 0")
+    await redis.hset(override_key(rule_name), user_id, int(limit))
+
+
+async def clear_user_limit(redis: Redis, rule_name: str, user_id: str) -> None:
+    get_rule(rule_name)
+    await redis.hdel(override_key(rule_name), user_id)
@@ -0,0 +1,151 @@
+"""
+AI 调用用量计量
+
+- 按月计数：usage:{YYYYMM}:{user_id}（hash，field 为 {feature}:calls / {feature}:tokens），
+  key 中带月份，次月自然从 0 开始，旧 key 到期自动删除，不需要对整张用户表做清零 UPDATE
+- 配额判断只读 Redis（一次 HGET），不查数据库
+- 待落库的增量累积在 usage:pending（hash，field 为用户 ID），后台任务定期原子取出，
+  分批累加到 User.token_usage（累计 token 用量），每个请求不再单独 UPDATE 一行
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "usage:pending"
+# 月度计数保留到次月结束，便于查看上月用量
+MONTH_KEY_TTL = 62 * 86400
+FLUSH_INTERVAL = 60
+FLUSH_BATCH_SIZE = 500
+
+# 各功能的月度配额，None 表示不限
+MONTHLY_CALL_LIMITS: Dict[str, Optional[int]] = {
+    "ai_assist": 100,
+    "article": 200,
+}
+
+# 原子取出并清空待落库的增量，多个 worker 同时 flush 也不会重复累加
+TAKE_PENDING_LUA = """
+local data = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return data
+"""
+
+_take_script = None
+
+
+def current_month() -> str:
+    return datetime.now().strftime("%Y%m")
+
+
+def month_key(user_id: str, month: Optional[str] = None) -> str:
+    return f"usage:{month or current_month()}:{user_id}"
+
+
+async def record_usage(redis: Redis, user_id: str, feature: str, tokens: Optional[int]) -> None:
+    """
+    记录一次实际的大模型调用
+    :param tokens: 上游返回的 total_tokens；上游没有返回时只计次数
+    """
+    tokens = max(int(tokens or 0), 0)
+    key = month_key(user_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hincrby(key, f"{feature}:calls", 1)
+        pipe.hincrby(key, f"{feature}:tokens", tokens)
+        pipe.expire(key, MONTH_KEY_TTL)
+        if tokens:
+            pipe.hincrby(PENDING_KEY, user_id, tokens)
+        await pipe.execute()
+
+
+async def get_usage(redis: Redis, user_id: str, month: Optional[str] = None) -> Dict:
+    """
+    :return: {"month", "features": {feature: {"calls", "tokens", "limit"}}}
+    """
+    month = month or current_month()
+    data = await redis.hgetall(month_key(user_id, month))
+    features = {}
+    for feature, limit in MONTHLY_CALL_LIMITS.items():
+        features[feature] = {
+            "calls": int(data.get(f"{feature}:calls", 0)),
+            "tokens": int(data.get(f"{feature}:tokens", 0)),
+            "limit": limit,
+        }
+    return {"month": month, "features": features}
+
+
+async def check_quota(redis: Redis, user: User, feature: str) -> None:
+    """
+    当月调用次数达到配额时返回 400；管理员不受限
+    """
+    limit = MONTHLY_CALL_LIMITS.get(feature)
+    if limit is None or user.is_admin:
+        return
+    calls = await redis.hget(month_key(str(user.id)), f"{feature}:calls")
+    if int(calls or 0) >= limit:
+        raise HTTPException(status_code=400, detail="本月API使用量已超")
+
+
+async def _take_pending(redis: Redis) -> List[Tuple[int, int]]:
+    global _take_script
+    if _take_script is None:
+        _take_script = redis.register_script(TAKE_PENDING_LUA)
+    data = await _take_script(keys=[PENDING_KEY], client=redis)
+    pairs = zip(data[::2], data[1::2])
+    return [(int(user_id), int(tokens)) for user_id, tokens in pairs if int(tokens)]
+
+
+async def _restore_pending(redis: Redis, items: Iterable[Tuple[int, int]]) -> None:
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id, tokens in items:
+            pipe.hincrby(PENDING_KEY, str(user_id), tokens)
+        await pipe.execute()
+
+
+async def flush_usage(redis: Redis) -> int:
+    """
+    把待落库的 token 增量累加到 User.token_usage，每批一个事务
+    写库失败的批次放回 usage:pending，下次再试
+    :return: 本次落库的用户数
+    """
+    items = await _take_pending(redis)
+    flushed = 0
+    for start in range(0, len(items), FLUSH_BATCH_SIZE):
+        batch = items[start:start + FLUSH_BATCH_SIZE]
+        try:
+            async with in_transaction():
+                for user_id, tokens in batch:
+                    await User.filter(id=user_id).update(token_usage=F("token_usage") + tokens)
+        except Exception:
+            logger.exception("token usage flush failed, %d users restored", len(items) - start)
+            await _restore_pending(redis, items[start:])
+            break
+        flushed += len(batch)
+    return flushed
+
+
+async def flush_loop(redis: Redis, interval: float = FLUSH_INTERVAL) -> None:
+    """
+    后台定期落库；任务取消（应用关闭）时再 flush 一次
+    """
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await flush_usage(redis)
+            except Exception:
+                logger.exception("token usage flush loop error")
+    finally:
+        try:
+            await flush_usage(redis)
+        except Exception:
+            logger.exception("final token usage flush failed")
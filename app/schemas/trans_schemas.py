@@ -1,10 +1,9 @@
-from typing import Literal
+from typing import List, Literal
 
-from pydantic import BaseModel, field_validator, model_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 
-class TransRequest(BaseModel):
-    query: str
+class TransLangPair(BaseModel):
     from_lang: Literal['auto', 'fra', 'jp', 'zh', 'en'] = 'auto'
     to_lang: Literal['fra', 'jp', 'zh', 'en'] = 'zh'
 
@@ -25,5 +24,33 @@ class TransRequest(BaseModel):
         return self
 
 
+class TransRequest(TransLangPair):
+    query: str
+
+
 class TransResponse(BaseModel):
     translated_text: str
+    source: Literal['cache', 'dictionary', 'baidu'] = 'baidu'
+
+
+class TransBatchRequest(TransLangPair):
+    segments: List[str] = Field(min_length=1, max_length=100)
+
+    @field_validator('segments')
+    @classmethod
+    def validate_segments(cls, v):
+        if any(not segment.strip() for segment in v):
+            raise ValueError('segments cannot contain blank items')
+        if sum(len(segment) for segment in v) > 30000:
+            raise ValueError('segments are too long')
+        return v
+
+
+class TransBatchItem(BaseModel):
+    translated_text: str
+    source: Literal['cache', 'baidu']
+
+
+class TransBatchResponse(BaseModel):
+    results: List[TransBatchItem]
+    upstream_calls: int
@@ -0,0 +1,29 @@
+"""
+Redis 中压缩存储 JSON
+
+共享的 Redis 客户端开启了 decode_responses，值必须是文本，
+因此 zlib 压缩后再 base64，并加上格式前缀以便识别与日后升级。
+"""
+import base64
+import json
+import zlib
+from typing import Any, Optional
+
+FORMAT_PREFIX = "z1:"
+
+
+def pack_json(obj: Any) -> str:
+    raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    return FORMAT_PREFIX + base64.b64encode(zlib.compress(raw.encode("utf-8"), 6)).decode("ascii")
+
+
+def unpack_json(data: Optional[str]) -> Optional[Any]:
+    """
+    :return: 解码后的对象；data 为空或不是 pack_json 的格式时返回 None
+    """
+    if not data or not data.startswith(FORMAT_PREFIX):
+        return None
+    try:
+        return json.loads(zlib.decompress(base64.b64decode(data[len(FORMAT_PREFIX):])))
+    except (ValueError, zlib.error):
+        return None
@@ -1,7 +1,7 @@
 from typing import Tuple, Dict, Annotated
 
 import redis.asyncio as redis
-from fastapi import HTTPException, Request, Depends
+from fastapi import HTTPException, Request, Depends, WebSocket
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError, ExpiredSignatureError
 
@@ -94,6 +94,23 @@ async def get_optional_current_user(
         return None
 
 
+async def get_websocket_user(websocket: WebSocket) -> Tuple[User, Dict]:
+    """
+    WebSocket 鉴权：浏览器建立 WebSocket 时无法设置请求头，
+    因此除 Authorization 头外也接受查询参数 ?token=
+    """
+    token = websocket.query_params.get("token")
+    if not token:
+        auth = websocket.headers.get("Authorization")
+        if not auth:
+            raise HTTPException(status_code=401, detail="未登录")
+        parts = auth.strip().split()
+        if len(parts) != 2 or parts[0].lower() != "bearer":
+            raise HTTPException(status_code=401, detail="无效的授权头")
+        token = parts[1]
+    return await _decode_and_load_user(token)
+
+
 async def is_admin_user(
         user_payload: Tuple[User, Dict] = Depends(get_current_user),
 ) -> Tuple[User, Dict]:
@@ -0,0 +1,14 @@
+import json
+from typing import Dict
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """
+    格式化一条 Server-Sent Event
+    :param event: 事件名，前端按事件名分别处理
+    :param data: 事件数据，序列化为一行 JSON
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
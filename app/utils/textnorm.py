@@ -1,7 +1,45 @@
-import re
 import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Optional
 
+# 批量规范化时用于拼接/切分的分隔符：NFKD、去重音、转小写都不会改变它，且不属于空白字符
+_BATCH_SEP = "\x00"
 
+
+def _fold_char(ch: str) -> str:
+    """单个字符的 NFKD 拆分 + 去除组合附加符（重音等），结果为该字符在翻译表中的映射"""
+    return "".join(c for c in unicodedata.normalize("NFKD", ch) if not unicodedata.combining(c))
+
+
+class _FoldTable(dict):
+    """
+    str.translate 使用的翻译表：常用的拉丁字母区预先计算，其余字符第一次出现时再计算并缓存。
+    NFKD 是逐字符分解的，规范重排只作用于组合附加符，而这些字符最终都会被去掉，
+    因此逐字符查表与整串 NFKD 后再过滤的结果一致。
+    """
+
+    def __missing__(self, codepoint: int) -> str:
+        folded = _fold_char(chr(codepoint))
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+# Latin-1 补充、拉丁扩展 A/B、IPA、组合附加符、拉丁扩展附加
+for _cp in (*range(0x80, 0x370), *range(0x1E00, 0x1F00)):
+    _FOLD_TABLE[_cp] = _fold_char(chr(_cp))
+del _cp
+
+
+def _normalize_uncached(s: str) -> str:
+    # ASCII 快速路径：NFKD 对 ASCII 无影响，也不存在组合附加符
+    if not s.isascii():
+        s = s.translate(_FOLD_TABLE)
+    # str.split() 与正则 \s 使用同一套 Unicode 空白定义，等价于 re.sub(r"\s+", " ", s.strip())
+    return " ".join(s.lower().split())
+
+
+@lru_cache(maxsize=4096)
 def normalize_text(s: str) -> str:
     """
     规范化字符串，用于搜索/存储 search_text
@@ -9,15 +47,30 @@ def normalize_text(s: str) -> str:
     - 去除重音符号（é -> e）
     - 转小写
     - 去掉前后空格，多空格合并
+    检索接口中重复出现的查询词直接命中 LRU 缓存
     """
     if not s:
         return ""
-    # 1. Unicode 标准化（NFKD 拆分）
-    s = unicodedata.normalize("NFKD", s)
-    # 2. 去掉音标/重音符
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    # 3. 转小写
-    s = s.lower()
-    # 4. 去掉首尾空格 & 合并多个空格
-    s = re.sub(r"\s+", " ", s.strip())
-    return s
+    return _normalize_uncached(s)
+
+
+def normalize_texts(items: Iterable[Optional[str]]) -> List[str]:
+    """
+    批量版本的 normalize_text，供导入、重建索引等按块处理的场景使用
+    - None / 空串统一返回 ""
+    - 输出顺序与输入一致
+    整块拼接后只做一次 translate / lower，不经过 LRU，避免批量数据把检索缓存挤掉
+    """
+    items = [s or "" for s in items]
+    if not items:
+        return []
+
+    joined = _BATCH_SEP.join(items)
+    if joined.count(_BATCH_SEP) != len(items) - 1:
+        # 原文本身包含分隔符，退回逐条处理
+        return [_normalize_uncached(s) for s in items]
+
+    if not joined.isascii():
+        joined = joined.translate(_FOLD_TABLE)
+    return [" ".join(part.split()) for part in joined.lower().split(_BATCH_SEP)]
+
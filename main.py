@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 import uvicorn
@@ -14,13 +15,16 @@ from app.api.culture_share.routes import culture_share_router
 from app.api.make_comments.routes import comment_router
 from app.api.miniapp.routes import miniapp_router
 from app.api.pronounciation_test.routes import pron_test_router
+from app.api.pronounciation_test.sentence_bank import load_all_banks
 from app.api.redis_test import redis_test_router
 from app.api.search_dict.routes import dict_search
-from app.api.translator import translator_router
+from app.api.translator.routes import translator_router
 from app.api.user.routes import users_router
 from app.api.util_api.routes import ulit_router
 from app.api.word_comment.routes import word_comment_router
+from app.core.http_clients import init_http_clients, close_http_clients
 from app.core.redis import init_redis, close_redis
+from app.core.usage_meter import flush_loop
 from app.utils.phone_encrypt import PhoneEncrypt
 from settings import ONLINE_SETTINGS, ROOT_DIR
 
@@ -30,11 +34,20 @@ async def lifespan(app: FastAPI):
     # ---- startup ----
     # 存放应用级别的共享对象
     app.state.redis = await init_redis()
+    # 各上游服务共享的 HTTP 连接池
+    app.state.http_clients = await init_http_clients()
     # phone_encrypt
     app.state.phone_encrypto = PhoneEncrypt.from_env()  # 接口中通过 Request 访问
+    # 发音测评题库加载到 Redis
+    await load_all_banks(app.state.redis)
+    # AI 用量定期从 Redis 落库
+    usage_flusher = asyncio.create_task(flush_loop(app.state.redis))
     try:
         yield
     finally:
+        usage_flusher.cancel()
+        await asyncio.gather(usage_flusher, return_exceptions=True)
+        await close_http_clients()
         await close_redis()
 
 
@@ -1,17 +1,148 @@
+"""
+重建检索字段 search_text
+
+按主键顺序分块读取（id > last_id ORDER BY id LIMIT n），批量规范化后只回写发生变化的行，
+每块一条 bulk_update（Tortoise 生成 UPDATE ... SET search_text = CASE id WHEN ... END WHERE id IN (...)）。
+每块写完后记录 checkpoint，中断后再次运行会从上次位置继续。
+
+用法（项目根目录）：
+    python -m scripts.backfill_search_text                         # 全部目标
+    python -m scripts.backfill_search_text -t wordlist_fr idiom_jp  # 指定目标
+    python -m scripts.backfill_search_text --reset                  # 忽略 checkpoint 从头开始
+    python -m scripts.backfill_search_text --dry-run                # 只统计，不写库
+"""
+import argparse
 import asyncio
-from tortoise import Tortoise, run_async
-from app.models.fr import WordlistFr
-from app.utils.textnorm import normalize_text
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Type
+
+from tortoise import Model, Tortoise
+
+from app.models.fr import ProverbFr, WordlistFr
+from app.models.jp import IdiomJp
+from app.utils.all_kana import all_in_kana
+from app.utils.textnorm import normalize_texts
 from settings import TORTOISE_ORM
 
-async def main():
+CHECKPOINT_PATH = Path(__file__).with_name("backfill_search_text.checkpoint.json")
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _kana_texts(items: Iterable[Optional[str]]) -> List[str]:
+    return [all_in_kana(s) if s else "" for s in items]
+
+
+@dataclass(frozen=True)
+class ReindexTarget:
+    model: Type[Model]
+    source_field: str
+    normalizer: Callable[[Iterable[Optional[str]]], List[str]]
+    target_field: str = "search_text"
+
+
+TARGETS: Dict[str, ReindexTarget] = {
+    # 法语词条 / 谚语：与 pre_save 信号、检索接口使用同一个 normalize_text
+    "wordlist_fr": ReindexTarget(WordlistFr, "text", normalize_texts),
+    "proverb_fr": ReindexTarget(ProverbFr, "text", normalize_texts),
+    # 日语惯用语的 search_text 是表格中人工校对的读音，不能由原文推导；
+    # 这里只把读音统一成检索时使用的平假名形式（all_in_kana 对平假名幂等）
+    "idiom_jp": ReindexTarget(IdiomJp, "search_text", _kana_texts),
+}
+
+
+def load_checkpoint() -> Dict[str, int]:
+    if CHECKPOINT_PATH.exists():
+        return json.loads(CHECKPOINT_PATH.read_text(encoding="utf-8"))
+    return {}
+
+
+def save_checkpoint(checkpoint: Dict[str, int]) -> None:
+    tmp = CHECKPOINT_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(checkpoint, indent=2), encoding="utf-8")
+    tmp.replace(CHECKPOINT_PATH)  # 原子替换，避免中断时留下半截文件
+
+
+async def reindex_target(
+        name: str,
+        checkpoint: Dict[str, int],
+        lock: asyncio.Lock,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        dry_run: bool = False,
+) -> Dict[str, int]:
+    target = TARGETS[name]
+    fields = {"id", target.source_field, target.target_field}
+    last_id = checkpoint.get(name, 0)
+    scanned = updated = 0
+
+    while True:
+        rows = await (
+            target.model.filter(id__gt=last_id)
+            .order_by("id")
+            .limit(chunk_size)
+            .only(*fields)
+        )
+        if not rows:
+            break
+
+        wanted = target.normalizer(getattr(r, target.source_field) for r in rows)
+        changed = []
+        for row, want in zip(rows, wanted):
+            if getattr(row, target.target_field) != want:
+                setattr(row, target.target_field, want)
+                changed.append(row)
+
+        if changed and not dry_run:
+            await target.model.bulk_update(changed, fields=[target.target_field])
+
+        scanned += len(rows)
+        updated += len(changed)
+        last_id = rows[-1].id
+
+        if not dry_run:
+            async with lock:
+                checkpoint[name] = last_id
+                save_checkpoint(checkpoint)
+        print(f"[{name}] 已处理至 id={last_id}，累计扫描 {scanned}，更新 {updated}")
+
+        if len(rows) < chunk_size:
+            break
+
+    return {"scanned": scanned, "updated": updated}
+
+
+async def main(targets: List[str], chunk_size: int, reset: bool, dry_run: bool) -> None:
     await Tortoise.init(config=TORTOISE_ORM)
-    async for w in WordlistFr.all().only("id", "text", "search_text"):  # type: WordlistFr
-        want = normalize_text(w.text)
-        if w.search_text != want:
-            w.search_text = want
-            await w.save(update_fields=["search_text"])
-    await Tortoise.close_connections()
+    try:
+        checkpoint = {} if reset else load_checkpoint()
+        lock = asyncio.Lock()
+        # 不同表之间互不依赖，并发执行
+        results = await asyncio.gather(*(
+            reindex_target(name, checkpoint, lock, chunk_size=chunk_size, dry_run=dry_run)
+            for name in targets
+        ))
+        for name, stat in zip(targets, results):
+            print(f"✅ {name}: 扫描 {stat['scanned']} 行，更新 {stat['updated']} 行")
+
+        # 全部完成后清除对应 checkpoint，下次运行重新全量校验
+        if not dry_run:
+            for name in targets:
+                checkpoint.pop(name, None)
+            save_checkpoint(checkpoint)
+    finally:
+        await Tortoise.close_connections()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="重建 search_text 检索字段")
+    parser.add_argument("-t", "--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--reset", action="store_true", help="忽略 checkpoint，从头开始")
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要更新的行数，不写库")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    run_async(main())
\ No newline at end of file
+    args = parse_args()
+    asyncio.run(main(args.targets, args.chunk_size, args.reset, args.dry_run))
@@ -0,0 +1,73 @@
+"""
+normalize_text 查表实现与原始实现（整串 NFKD + 过滤 + 正则合并空白）的对比
+
+- 等价性：固定样例 + 覆盖 BMP 的随机字符串，单条与批量版本都必须与原始实现一致
+- 基准：原始实现、查表、批量、LRU 命中四种方式的单条耗时
+
+用法（项目根目录）：
+    python -m scripts.bench_textnorm
+    python -m scripts.bench_textnorm --random 50000 --repeat 10
+"""
+import argparse
+import random
+import re
+import sys
+import timeit
+import unicodedata
+
+from app.utils.textnorm import _normalize_uncached, normalize_text, normalize_texts
+
+SAMPLES = [
+    "", "  ", "Être", "  À   la  carte ", "Ça va\tbien\n", "ŒUVRE", "naïveté", "ﬁnancière",
+    "ΟΔΥΣΣΕΥΣ", "İstanbul", "Ａｂｃ　ｄｅｆ", "ｶﾞｷﾞ", "がぎぐ", "한국어", "x̧́y",
+    " nbsp em　ideo ", "Straße", "ǅemal", "①②", "㍻", "été",
+]
+WORDS = ["étudier", "Être", "avoir", "À la carte", "rendez-vous", "naïveté", "cœur", "Ça"]
+
+
+def normalize_text_reference(s: str) -> str:
+    """原始实现"""
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.lower()
+    s = re.sub(r"\s+", " ", s.strip())
+    return s
+
+
+def check_equivalence(n_random: int) -> None:
+    # 随机字符串：覆盖 BMP 内除代理区外的所有字符
+    rng = random.Random(0)
+    pool = [chr(cp) for cp in range(0x20, 0x10000) if not 0xD800 <= cp <= 0xDFFF]
+    samples = SAMPLES + ["".join(rng.choices(pool, k=rng.randint(1, 12))) for _ in range(n_random)]
+
+    for s in samples:
+        if normalize_text(s) != normalize_text_reference(s):
+            sys.exit(f"mismatch (single) for {s!r}")
+    if normalize_texts(samples) != [normalize_text_reference(s) for s in samples]:
+        sys.exit("mismatch (batch)")
+    print(f"equivalence ok: {len(samples)} samples")
+
+
+def bench(repeat: int) -> None:
+    words = WORDS * 1000
+    t_ref = timeit.timeit(lambda: [normalize_text_reference(w) for w in words], number=repeat)
+    t_new = timeit.timeit(lambda: [_normalize_uncached(w) for w in words], number=repeat)
+    t_batch = timeit.timeit(lambda: normalize_texts(words), number=repeat)
+    normalize_text.cache_clear()
+    t_cached = timeit.timeit(lambda: [normalize_text(w) for w in words], number=repeat)
+    per = len(words) * repeat / 1e6
+    print(f"reference : {t_ref / per:7.3f} µs/item")
+    print(f"table     : {t_new / per:7.3f} µs/item")
+    print(f"batch     : {t_batch / per:7.3f} µs/item")
+    print(f"lru       : {t_cached / per:7.3f} µs/item")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="normalize_text 等价性校验与基准对比")
+    parser.add_argument("--random", type=int, default=20000, help="随机字符串样例数")
+    parser.add_argument("--repeat", type=int, default=5, help="基准重复次数")
+    args = parser.parse_args()
+    check_equivalence(args.random)
+    bench(args.repeat)
@@ -0,0 +1,106 @@
+"""
+WAV 快速路径（NumPy 混音 + 重采样）与 ffmpeg 的对比
+
+对合成的多声道 WAV 分别用 normalize_wav 与 ffmpeg 转成 16 kHz 单声道 16-bit，输出：
+- 每种输入格式两种方式的平均耗时（ffmpeg 含进程启动）
+- 两份输出之间的信噪比（以 ffmpeg 输出为参考），用于确认快速路径的音质
+- 线上实际走的路径（prefers_ffmpeg）：只有 NumPy 更慢的非 16-bit 输入走 ffmpeg
+
+用法（项目根目录）：
+    python -m scripts.bench_wav_fast_path
+    python -m scripts.bench_wav_fast_path --seconds 30 --repeat 10
+"""
+import argparse
+import subprocess
+import time
+import wave
+from io import BytesIO
+from typing import Tuple
+
+import numpy as np
+
+from app.api.pronounciation_test.audio import ffmpeg_exe, normalize_wav, prefers_ffmpeg
+
+# (采样率, 声道数, 采样字节数)
+FORMATS = [
+    (16000, 1, 2),
+    (44100, 1, 2),
+    (44100, 2, 2),
+    (48000, 2, 2),
+    (48000, 2, 3),
+]
+
+
+def synth_wav(rate: int, channels: int, width: int, seconds: float) -> bytes:
+    """几个谐波加少量噪声，模拟语音的频谱范围（含高于 8 kHz 的成分，用于检查抗混叠）"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * seconds)) / rate
+    signal = sum(0.15 * np.sin(2 * np.pi * f * t) for f in (180, 440, 1250, 3100, 6500, 11000))
+    signal = signal + 0.01 * rng.standard_normal(len(t))
+    samples = np.stack([signal * (0.8 + 0.2 * c) for c in range(channels)], axis=1)
+
+    scale = 2 ** (8 * width - 1) - 1
+    ints = np.round(samples * scale).astype("<i4")
+    if width == 2:
+        frames = ints.astype("<i2").tobytes()
+    else:
+        # 24-bit：取 int32 的低 3 字节
+        frames = ints.view(np.uint8).reshape(-1, 4)[:, :width].tobytes()
+
+    buf = BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(width)
+        wf.setframerate(rate)
+        wf.writeframes(frames)
+    return buf.getvalue()
+
+
+def ffmpeg_convert(data: bytes) -> bytes:
+    return subprocess.run(
+        [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", "16000", "-sample_fmt", "s16", "-f", "wav", "pipe:1"],
+        input=data, stdout=subprocess.PIPE, check=True,
+    ).stdout
+
+
+def read_pcm(data: bytes) -> np.ndarray:
+    with wave.open(BytesIO(data), "rb") as wf:
+        return np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2").astype(np.float64)
+
+
+def snr_db(reference: np.ndarray, test: np.ndarray) -> float:
+    n = min(len(reference), len(test))
+    # 两端各去掉 50ms，避免边界处理方式不同带来的差异
+    edge = 800
+    reference, test = reference[edge:n - edge], test[edge:n - edge]
+    noise = np.sum((reference - test) ** 2)
+    return float("inf") if noise == 0 else 10 * np.log10(np.sum(reference ** 2) / noise)
+
+
+def timeit(func, data: bytes, repeat: int) -> Tuple[float, bytes]:
+    result = func(data)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(data)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main(seconds: float, repeat: int) -> None:
+    print(f"{'format':<22}{'numpy ms':>10}{'ffmpeg ms':>11}{'speedup':>9}{'SNR dB':>9}{'route':>8}")
+    for rate, channels, width in FORMATS:
+        data = synth_wav(rate, channels, width, seconds)
+        fast_ms, fast = timeit(lambda d: normalize_wav(d, force=True), data, repeat)
+        ffmpeg_ms, reference = timeit(ffmpeg_convert, data, repeat)
+        snr = snr_db(read_pcm(reference), read_pcm(fast))
+        label = f"{rate}Hz/{channels}ch/{width * 8}bit"
+        route = "ffmpeg" if prefers_ffmpeg(rate, channels, width) else "numpy"
+        print(f"{label:<22}{fast_ms:>10.1f}{ffmpeg_ms:>11.1f}{ffmpeg_ms / max(fast_ms, 1e-6):>8.1f}x{snr:>9.1f}{route:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WAV 快速路径与 ffmpeg 的耗时与音质对比")
+    parser.add_argument("--seconds", type=float, default=10, help="合成音频时长")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式重复次数")
+    args = parser.parse_args()
+    main(args.seconds, args.repeat)
@@ -0,0 +1,215 @@
+"""
+离线预生成高频词的 AI 解释
+
+按 freq 取法语、日语词表前 N 个词，附上词典释义请求大模型生成一段标准解释，写入 Redis（ai_assist:pregen），
+/ai_assist/word/exp 的首轮“解释这个词”类提问直接返回，不再实时调用大模型。
+
+- 并发受 --concurrency 限制；每处理完一块写一次 checkpoint，中断后再次运行从上次位置继续；
+  checkpoint 不会越过第一个生成失败的词，下次运行从该词重试（其后已生成的词按哈希跳过）
+- 释义（及提示词版本）的哈希与已生成条目一致的词直接跳过，只重新生成释义有变化的词
+- --fake 使用本地替身按释义拼出解释，不请求大模型，用于测试与演练
+
+用法（项目根目录）：
+    python -m scripts.pregen_ai_explanations --top 2000                # 法语、日语各前 2000 个词
+    python -m scripts.pregen_ai_explanations -l fr --top 500 -c 4
+    python -m scripts.pregen_ai_explanations --reset                   # 忽略 checkpoint 从头开始
+    python -m scripts.pregen_ai_explanations --fake                    # 本地替身，不调用大模型
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from tortoise import Tortoise
+
+from app.api.ai_assist import service
+from app.api.ai_assist.ai_schemas import AIAnswerResponse
+from app.core.http_clients import close_http_clients, get_http_client
+from app.core.redis import close_redis, init_redis
+from app.models.fr import DefinitionFr, WordlistFr
+from app.models.jp import DefinitionJp, WordlistJp
+from settings import TORTOISE_ORM
+
+CHECKPOINT_PATH = Path(__file__).with_name("pregen_ai_explanations.checkpoint.json")
+LANGS = ("fr", "jp")
+
+# (词, 提示词) → (解释, 模型名)
+Generator = Callable[[str, List[Dict]], Awaitable[Tuple[str, str]]]
+
+
+def load_checkpoint() -> Dict[str, int]:
+    if CHECKPOINT_PATH.exists():
+        return json.loads(CHECKPOINT_PATH.read_text(encoding="utf-8"))
+    return {}
+
+
+def save_checkpoint(checkpoint: Dict[str, int]) -> None:
+    tmp = CHECKPOINT_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(checkpoint, indent=2), encoding="utf-8")
+    tmp.replace(CHECKPOINT_PATH)  # 原子替换，避免中断时留下半截文件
+
+
+def definitions_hash(definitions: List[str]) -> str:
+    raw = "\x1f".join([service.PREGEN_PROMPT_VERSION, *definitions])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def top_words(lang: str, top: int) -> List[str]:
+    """按词频取前 top 个词（去重，日语同形词合并）"""
+    model = WordlistFr if lang == "fr" else WordlistJp
+    texts = await model.all().order_by("-freq", "id").limit(top).values_list("text", flat=True)
+    return list(dict.fromkeys(texts))
+
+
+async def load_definitions(lang: str, words: List[str]) -> Dict[str, List[str]]:
+    """
+    :return: {词: 释义行}，按释义 id 排序，作为提示词的一部分并用于计算哈希
+    """
+    result: Dict[str, List[str]] = defaultdict(list)
+    if lang == "fr":
+        rows = await DefinitionFr.filter(word__text__in=words).order_by("id").values(
+            "word__text", "pos", "meaning", "eng_explanation", "example"
+        )
+        for row in rows:
+            pos = row["pos"].value if hasattr(row["pos"], "value") else row["pos"]
+            parts = [f"[{pos}]" if pos else "", row["meaning"] or ""]
+            if row["eng_explanation"]:
+                parts.append(f"({row['eng_explanation']})")
+            if row["example"]:
+                parts.append(f"例：{row['example']}")
+            result[row["word__text"]].append(" ".join(p for p in parts if p))
+    else:
+        rows = await DefinitionJp.filter(word__text__in=words).order_by("id").values(
+            "word__text", "word__hiragana", "meaning", "example"
+        )
+        for row in rows:
+            parts = [f"【{row['word__hiragana']}】" if row["word__hiragana"] else "", row["meaning"] or ""]
+            if row["example"]:
+                parts.append(f"例：{row['example']}")
+            result[row["word__text"]].append(" ".join(p for p in parts if p))
+    return result
+
+
+async def ai_generator(word: str, messages: List[Dict]) -> Tuple[str, str]:
+    resp = await get_http_client("ai_assist").post(
+        service.ZJU_AI_URL,
+        json=service.build_payload(messages, stream=False),
+        headers=service.request_headers(),
+    )
+    resp.raise_for_status()
+    ai_resp = AIAnswerResponse(**resp.json())
+    return ai_resp.get_answer(), ai_resp.model
+
+
+async def fake_generator(word: str, messages: List[Dict]) -> Tuple[str, str]:
+    # 本地替身：直接把提示词中的词典释义整理成解释
+    definitions = messages[-1]["content"].split("词典释义：\n", 1)[-1]
+    return f"「{word}」的常见意思：\n{definitions}", "local-fake"
+
+
+async def pregen_lang(
+        redis,
+        lang: str,
+        top: int,
+        checkpoint: Dict[str, int],
+        generate: Generator,
+        concurrency: int,
+        dry_run: bool = False,
+) -> Dict[str, int]:
+    words = await top_words(lang, top)
+    start = checkpoint.get(lang, 0)
+    stats = {"generated": 0, "skipped": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    chunk_size = concurrency * 4
+
+    async def one(word: str, definitions: List[str], def_hash: str) -> bool:
+        async with semaphore:
+            try:
+                answer, model = await generate(word, service.build_explain_messages(word, definitions))
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"[{lang}] {word} 生成失败：{e}")
+                return False
+        if not answer.strip():
+            stats["failed"] += 1
+            return False
+        await service.set_pregenerated(redis, word, {
+            "word": word,
+            "lang": lang,
+            "question": service.PREGEN_QUESTION,
+            "answer": answer,
+            "model": model,
+            "def_hash": def_hash,
+            "generated_at": int(time.time()),
+        })
+        stats["generated"] += 1
+        return True
+
+    # 第一个生成失败的词在 words 中的位置；checkpoint 不越过它
+    first_failed = None
+    for offset in range(start, len(words), chunk_size):
+        chunk = words[offset:offset + chunk_size]
+        definitions = await load_definitions(lang, chunk)
+        existing = await service.get_pregenerated_hashes(redis, chunk)
+
+        jobs, positions = [], []
+        for position, word in enumerate(chunk, start=offset):
+            def_hash = definitions_hash(definitions.get(word, []))
+            if existing.get(word) == def_hash:
+                stats["skipped"] += 1
+                continue
+            jobs.append((word, definitions.get(word, []), def_hash))
+            positions.append(position)
+
+        if not dry_run:
+            succeeded = await asyncio.gather(*(one(*job) for job in jobs))
+            if first_failed is None:
+                first_failed = next((p for p, ok in zip(positions, succeeded) if not ok), None)
+            checkpoint[lang] = first_failed if first_failed is not None else offset + len(chunk)
+            save_checkpoint(checkpoint)
+        else:
+            stats["generated"] += len(jobs)
+        print(f"[{lang}] 已处理 {offset + len(chunk)}/{len(words)}，"
+              f"生成 {stats['generated']}，跳过 {stats['skipped']}，失败 {stats['failed']}")
+
+    return stats
+
+
+async def main(langs: List[str], top: int, concurrency: int, reset: bool, fake: bool, dry_run: bool) -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    redis = await init_redis()
+    try:
+        checkpoint = {} if reset else load_checkpoint()
+        generate = fake_generator if fake else ai_generator
+        for lang in langs:
+            stats = await pregen_lang(redis, lang, top, checkpoint, generate, concurrency, dry_run=dry_run)
+            print(f"✅ {lang}: 生成 {stats['generated']}，跳过 {stats['skipped']}，失败 {stats['failed']}")
+            # 全部完成后清除 checkpoint，下次运行按释义哈希重新校验；
+            # 有失败时保留（指向第一个失败的词），下次运行从该词重试
+            if not dry_run and not stats["failed"]:
+                checkpoint.pop(lang, None)
+                save_checkpoint(checkpoint)
+    finally:
+        await close_http_clients()
+        await close_redis()
+        await Tortoise.close_connections()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="离线预生成高频词的 AI 解释")
+    parser.add_argument("-l", "--langs", nargs="+", choices=LANGS, default=list(LANGS))
+    parser.add_argument("--top", type=int, default=2000, help="每种语言按词频取前 N 个词")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时进行的大模型请求数")
+    parser.add_argument("--reset", action="store_true", help="忽略 checkpoint，从头开始")
+    parser.add_argument("--fake", action="store_true", help="使用本地替身生成解释，不调用大模型")
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要生成的词数，不写入")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(args.langs, args.top, args.concurrency, args.reset, args.fake, args.dry_run))
@@ -79,8 +79,16 @@ class Settings(BaseSettings):
     AI_ASSIST_KEY: str
 
     ECNU_TEACH_AI_KEY: str
+    # 作文指导会话超出 token 预算时，是否把移出窗口的早期对话交给模型压缩成摘要
+    ARTICLE_SESSION_SUMMARIZE: bool = False
 
     AZURE_SUBSCRIPTION_KEY: str
+    # 发音测评后端：azure / fake（本地打分替身，用于压测）
+    PRON_SCORER: str = "azure"
+    PRON_ASSESS_CONCURRENCY: int = 8
+    PRON_ASSESS_TIMEOUT: float = 20
+    # 同时进行的 Azure 实时推流测评（WebSocket）数，与 PRON_ASSESS_CONCURRENCY 分开计
+    PRON_STREAM_CONCURRENCY: int = 16
 
     class Config:
         env_file = ROOT_DIR / '.env'